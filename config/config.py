@@ -1,5 +1,6 @@
 import os
 from dataclasses import dataclass
+from functools import cache
 
 from dotenv import load_dotenv
 
@@ -9,6 +10,10 @@ load_dotenv()
 @dataclass
 class TgBot:
     token: str
+    api_url: str | None
+    local_api: bool
+    api_files_path: str | None
+    local_files_path: str | None
 
 
 @dataclass
@@ -17,21 +22,105 @@ class RedisConfig:
     redis_port: int
     redis_db: int
     redis_password: str
+    max_connections: int
+    socket_timeout: float
+    socket_connect_timeout: float
+    health_check_interval: int
+    retries: int
+
+
+@dataclass
+class ThrottlingConfig:
+    # Лимиты загрузок и очереди общие: при BOT_WORKERS > 1 каждый воркер получает равную долю.
+    # Лимит на пользователя не делится — все обновления пользователя попадают в один воркер.
+    # INTERACTIVE_CONCURRENCY действует в каждом процессе отдельно.
+    max_concurrent_uploads: int
+    max_uploads_per_user: int
+    max_upload_queue: int
+    interactive_concurrency: int
+
+
+@dataclass
+class WorkersConfig:
+    count: int
+    index: int | None
+
+
+@dataclass
+class MonitoringConfig:
+    loop_lag_threshold: float
+    loop_monitor_interval: float
+    metrics_port: int | None
+
+
+@dataclass
+class StagingConfig:
+    # Общий лимит на все процессы: при BOT_WORKERS > 1 каждый воркер получает равную долю
+    quota_mb: int
+    max_age: float
+    cleanup_interval: int
+
+
+@dataclass
+class CaptureConfig:
+    directory: str | None
 
 
 @dataclass
 class Config:
     tg_bot: TgBot
     redis: RedisConfig
+    throttling: ThrottlingConfig
+    workers: WorkersConfig
+    monitoring: MonitoringConfig
+    staging: StagingConfig
+    capture: CaptureConfig
 
 
 def load_config(path: str | None = None) -> Config:
     return Config(
-        tg_bot=TgBot(token=os.getenv("SECRET_KEY")),
+        tg_bot=TgBot(
+            token=os.getenv("SECRET_KEY"),
+            api_url=os.getenv("TELEGRAM_API_URL"),
+            local_api=os.getenv("TELEGRAM_API_LOCAL", "false").lower() in ("1", "true", "yes"),
+            api_files_path=os.getenv("TELEGRAM_API_FILES_PATH"),
+            local_files_path=os.getenv("TELEGRAM_LOCAL_FILES_PATH"),
+        ),
         redis=RedisConfig(
             redis_host=os.getenv("REDIS_HOST"),
             redis_port=int(os.getenv("REDIS_PORT")),
             redis_db=int(os.getenv("REDIS_DB")),
             redis_password=os.getenv("REDIS_PASSWORD"),
+            max_connections=int(os.getenv("REDIS_MAX_CONNECTIONS", 50)),
+            socket_timeout=float(os.getenv("REDIS_SOCKET_TIMEOUT", 10)),
+            socket_connect_timeout=float(os.getenv("REDIS_CONNECT_TIMEOUT", 5)),
+            health_check_interval=int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", 30)),
+            retries=int(os.getenv("REDIS_RETRIES", 3)),
+        ),
+        throttling=ThrottlingConfig(
+            max_concurrent_uploads=int(os.getenv("MAX_CONCURRENT_UPLOADS", 4)),
+            max_uploads_per_user=int(os.getenv("MAX_UPLOADS_PER_USER", 1)),
+            max_upload_queue=int(os.getenv("MAX_UPLOAD_QUEUE", 50)),
+            interactive_concurrency=int(os.getenv("INTERACTIVE_CONCURRENCY", 64)),
         ),
+        workers=WorkersConfig(
+            count=int(os.getenv("BOT_WORKERS", 1)),
+            index=int(os.environ["BOT_WORKER_INDEX"]) if os.getenv("BOT_WORKER_INDEX") else None,
+        ),
+        monitoring=MonitoringConfig(
+            loop_lag_threshold=float(os.getenv("LOOP_LAG_THRESHOLD", 0.1)),
+            loop_monitor_interval=float(os.getenv("LOOP_MONITOR_INTERVAL", 0.5)),
+            metrics_port=int(os.getenv("METRICS_PORT")) if os.getenv("METRICS_PORT") else None,
+        ),
+        staging=StagingConfig(
+            quota_mb=int(os.getenv("STAGING_QUOTA_MB", 1024)),
+            max_age=float(os.getenv("STAGING_MAX_AGE", 3600)),
+            cleanup_interval=int(os.getenv("STAGING_CLEANUP_INTERVAL", 600)),
+        ),
+        capture=CaptureConfig(directory=os.getenv("TRAFFIC_CAPTURE_DIR")),
     )
+
+
+@cache
+def get_config() -> Config:
+    return load_config()
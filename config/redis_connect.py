@@ -1,12 +1,34 @@
-import redis.asyncio as redis_async
+from functools import cache
+from typing import TYPE_CHECKING
 
-from config.config import load_config
+from config.config import get_config
 
-config = load_config()
+if TYPE_CHECKING:
+    import redis.asyncio as redis_async
 
-redis_client = redis_async.Redis(
-    host=config.redis.redis_host,
-    port=config.redis.redis_port,
-    db=config.redis.redis_db,
-    password=config.redis.redis_password,
-)
+
+@cache
+def get_redis() -> "redis_async.Redis":
+    import redis.asyncio as redis_async
+    from redis.asyncio.retry import Retry
+    from redis.backoff import ExponentialBackoff
+    from redis.exceptions import ConnectionError, TimeoutError
+
+    config = get_config()
+    # socket_timeout должен быть больше таймаута BLPOP в воркерах (1 с)
+    pool = redis_async.BlockingConnectionPool(
+        host=config.redis.redis_host,
+        port=config.redis.redis_port,
+        db=config.redis.redis_db,
+        password=config.redis.redis_password,
+        max_connections=config.redis.max_connections,
+        timeout=config.redis.socket_timeout,
+        socket_timeout=config.redis.socket_timeout,
+        socket_connect_timeout=config.redis.socket_connect_timeout,
+        socket_keepalive=True,
+        health_check_interval=config.redis.health_check_interval,
+        retry=Retry(ExponentialBackoff(cap=1.0, base=0.05), config.redis.retries),
+        retry_on_error=[ConnectionError, TimeoutError],
+        decode_responses=True,
+    )
+    return redis_async.Redis(connection_pool=pool)
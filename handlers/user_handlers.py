@@ -1,3 +1,4 @@
+import asyncio
 import os
 import uuid
 from datetime import datetime, timezone
@@ -6,13 +7,12 @@ from aiogram import Bot, F, Router
 from aiogram.enums import ContentType
 from aiogram.filters import Command, CommandStart
 from aiogram.fsm.context import FSMContext
-from aiogram.types import Message
+from aiogram.types import Document, Message
 
 from fsm.fsm import UserState
 from handlers.utils import (
     download_file,
     get_shop_by_phone,
-    get_user_profile,
     save_file_to_post,
     save_report,
     save_user_profile,
@@ -24,14 +24,80 @@ from keyboards.keyboards import (
     get_photo_keyboard,
     get_photo_type_keyboard,
 )
+from middlewares.throttling import UploadTicket
+from middlewares.user_profile import invalidate_user_context, load_shop
 from services.logger import logger
+from services.staging import get_staging
 
 router = Router()
 
+_background_tasks: set[asyncio.Task] = set()
+
+
+async def prefetch_shop(state: FSMContext, phone_number: str):
+    shop = await load_shop(phone_number)
+    if shop:
+        await state.update_data(shop=shop)
+
+
+def get_upload_error_text(error_message: str) -> str:
+    if "более 5 минут назад" in error_message:
+        return "❌ Фото сделано более 5 минут назад. Пожалуйста, сделайте свежее фото."
+    if "Недостаточно места" in error_message:
+        return "❌ Сервер сейчас перегружен загрузками. Пожалуйста, отправьте фото через несколько минут."
+    if "EXIF данные отсутствуют" in error_message or "метаданные отсутствуют" in error_message.lower():
+        return (
+            "❌ Фото не содержит необходимые метаданные (EXIF). "
+            "Пожалуйста, сделайте фото через камеру телефона."
+        )
+    return "❌ Ошибка при сохранении файла."
+
+
+async def upload_document(
+    bot: Bot,
+    document: Document,
+    shop,
+    location,
+    type_photo,
+    upload_ticket: UploadTicket,
+):
+    # Слот держится на все время: get_file, скачивание, конвертация и отправка поста
+    async with upload_ticket.heavy_slot():
+        file = await bot.get_file(document.file_id)
+        file_path = file.file_path
+        file_name = document.file_name or f"{uuid.uuid4().hex}{os.path.splitext(file_path)[1]}"
+
+        logger.info("Загрузка файла: file_id=%s, path=%s, name=%s", document.file_id, file_path, file_name)
+
+        api = bot.session.api
+        file_url = api.file_url(bot.token, file_path)
+        local_path = str(api.wrap_local_file.to_local(file_path)) if api.is_local else None
+        relative_path = await download_file(
+            file_url, file_name, local_path=local_path, file_size=document.file_size
+        )
+
+        upload = {
+            "shop_id": shop["id"],
+            "latitude": location["latitude"],
+            "longitude": location["longitude"],
+            "type_photo": type_photo,
+        }
+        staging = get_staging()
+        await asyncio.to_thread(staging.mark_ready, relative_path, upload)
+        try:
+            result = await save_file_to_post(relative_path=relative_path, **upload)
+        finally:
+            await asyncio.to_thread(staging.release, relative_path)
+        if not result["success"]:
+            raise Exception(f"Не удалось создать пост: {result.get('status')} {result.get('error')}")
+
+        logger.info("Файл сохранен: %s для магазина %s", file_name, shop['shop_name'])
+        return relative_path
+
 
 @router.message(CommandStart())
 async def cmd_start(message: Message, state: FSMContext):
-    logger.info(f"/start от {message.from_user.id} ({message.from_user.full_name})")
+    logger.info("/start от %s (%s)", message.from_user.id, message.from_user.full_name)
     await message.answer(
         "👋 Привет! Я бот для загрузки фотографий магазинов.\n\n"
         "Для начала работы, пожалуйста, поделитесь своим контактом, "
@@ -55,11 +121,10 @@ async def cmd_help(message: Message):
     )
 
 
-@router.message(Command("profile"))
-@router.message(F.text == "👤 Мой профиль")
-async def cmd_profile(message: Message, state: FSMContext):
-    user = await get_user_profile(message.from_user.id)
-    if not user:
+@router.message(Command("profile"), flags={"shop": True})
+@router.message(F.text == "👤 Мой профиль", flags={"shop": True})
+async def cmd_profile(message: Message, state: FSMContext, user_profile: dict | None, shop):
+    if not user_profile:
         await message.answer(
             "Вы еще не авторизованы. Пожалуйста, поделитесь своим контактом для авторизации.",
             reply_markup=get_contact_keyboard(),
@@ -67,18 +132,19 @@ async def cmd_profile(message: Message, state: FSMContext):
         await state.set_state(UserState.unauthorized)
         return
 
-    shop = await get_shop_by_phone(user["phone_number"])
     if shop:
         await message.answer(
             f"📊 <b>Ваш профиль:</b>\n\n"
             f"🏪 Магазин: {shop['shop_name']}\n"
             f"👤 Владелец: {shop['owner_name']}\n"
             f"📍 Адрес: {shop['address']}\n"
-            f"📱 Телефон: {user['phone_number']}",
+            f"📱 Телефон: {user_profile['phone_number']}",
             reply_markup=get_main_keyboard(),
         )
     else:
-        await message.answer(f"📱 Телефон: {user['phone_number']}\n\n❗ Этот номер не найден в системе магазинов.")
+        await message.answer(
+            f"📱 Телефон: {user_profile['phone_number']}\n\n❗ Этот номер не найден в системе магазинов."
+        )
 
 
 @router.message(F.content_type == ContentType.CONTACT)
@@ -86,7 +152,7 @@ async def handle_contact(message: Message, state: FSMContext):
     contact = message.contact
     phone_number = contact.phone_number
     telegram_id = message.from_user.id
-    logger.info(f"Контакт от {telegram_id}: {phone_number}")
+    logger.info("Контакт от %s: %s", telegram_id, phone_number)
 
     if contact.user_id != telegram_id:
         await message.answer("Пожалуйста, отправьте свой собственный контакт.")
@@ -94,6 +160,7 @@ async def handle_contact(message: Message, state: FSMContext):
 
     try:
         await save_user_profile(telegram_id, phone_number)
+        invalidate_user_context(telegram_id)
         await state.update_data(phone=phone_number)
 
         shop = await get_shop_by_phone(phone_number)
@@ -113,25 +180,28 @@ async def handle_contact(message: Message, state: FSMContext):
                 "Обратитесь к администратору для регистрации вашего магазина."
             )
     except Exception as e:
-        logger.error(f"Error in handle_contact: {e}")
+        logger.error("Error in handle_contact: %s", e)
         await message.answer("Произошла ошибка при проверке вашего номера. Пожалуйста, попробуйте позже.")
 
 
-@router.message(UserState.authorized, F.text == "📷 Загрузить фото")
-async def start_upload_photo(message: Message, state: FSMContext):
+@router.message(UserState.authorized, F.text == "📷 Загрузить фото", flags={"profile": True})
+async def start_upload_photo(message: Message, state: FSMContext, user_profile: dict | None):
     await state.set_state(UserState.waiting_for_location)
+    await state.update_data(shop=None)
+    # Магазин загружается в фоне, пока пользователь отправляет геолокацию и выбирает тип фото
+    if user_profile:
+        task = asyncio.create_task(prefetch_shop(state, user_profile["phone_number"]))
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
     await message.answer(
         "Для загрузки фотографии сперва отправьте геолокацию магазина.",
         reply_markup=get_location_keyboard()
     )
 
 
-@router.message(UserState.waiting_for_location, F.content_type == ContentType.LOCATION)
-async def handle_location(message: Message, state: FSMContext):
-    telegram_id = message.from_user.id
-    user = await get_user_profile(telegram_id)
-
-    if not user:
+@router.message(UserState.waiting_for_location, F.content_type == ContentType.LOCATION, flags={"profile": True})
+async def handle_location(message: Message, state: FSMContext, user_profile: dict | None):
+    if not user_profile:
         await message.answer(
             "Для начала работы необходимо авторизоваться. Пожалуйста, поделитесь своим контактом.",
             reply_markup=get_contact_keyboard(),
@@ -173,100 +243,109 @@ async def handle_type_photo(message: Message, state: FSMContext):
     )
 
 
-@router.message(UserState.waiting_for_photo, F.content_type == ContentType.DOCUMENT)
-async def handle_file(message: Message, bot: Bot, state: FSMContext):
+@router.message(
+    UserState.waiting_for_photo,
+    F.content_type == ContentType.DOCUMENT,
+    flags={"heavy": True, "profile": True},
+)
+async def handle_file(
+    message: Message,
+    bot: Bot,
+    state: FSMContext,
+    user_profile: dict | None,
+    upload_ticket: UploadTicket,
+    album: list[Message] | None = None,
+):
     telegram_id = message.from_user.id
-    logger.info(f"Получен файл от user_id={telegram_id}")
+    documents = [m.document for m in album or [message] if m.document]
+    logger.info("Получено файлов: %s от user_id=%s", len(documents), telegram_id)
 
     try:
-        user_profile = await get_user_profile(telegram_id)
         if not user_profile:
-            logger.warning(f"Неизвестный пользователь: {telegram_id}")
+            logger.warning("Неизвестный пользователь: %s", telegram_id)
             await message.answer("Авторизуйтесь.")
             await state.set_state(UserState.unauthorized)
             return
 
-        state_data = await state.get_data()
+        status_text = "⏳ Загрузка файла..." if len(documents) == 1 else f"⏳ Загрузка файлов: {len(documents)}..."
+        state_data, status_message = await asyncio.gather(
+            state.get_data(),
+            bot.send_message(chat_id=message.chat.id, text=status_text),
+        )
         location = state_data.get("location")
         type_photo = state_data.get("type_photo")
 
         if not location:
-            logger.info(f"Нет геолокации для user_id={telegram_id}")
-            await message.answer("Сначала отправьте геолокацию.")
+            logger.info("Нет геолокации для user_id=%s", telegram_id)
+            await bot.edit_message_text(
+                "Сначала отправьте геолокацию.",
+                chat_id=status_message.chat.id,
+                message_id=status_message.message_id,
+            )
             await state.set_state(UserState.waiting_for_location)
             return
 
-        shop = await get_shop_by_phone(user_profile["phone_number"])
+        shop = state_data.get("shop") or await load_shop(user_profile["phone_number"])
         if not shop:
-            logger.warning(f"Магазин не найден: phone={user_profile['phone_number']}")
-            await message.answer("Ваш магазин не зарегистрирован.")
+            logger.warning("Магазин не найден: phone=%s", user_profile['phone_number'])
+            await bot.edit_message_text(
+                "Ваш магазин не зарегистрирован.",
+                chat_id=status_message.chat.id,
+                message_id=status_message.message_id,
+            )
             return
 
-        document = message.document
-        file_id = document.file_id
-        file = await bot.get_file(file_id)
-        file_path = file.file_path
-        file_name = document.file_name or f"{uuid.uuid4().hex}{os.path.splitext(file_path)[1]}"
-
-        logger.info(f"Загрузка файла от {telegram_id}: file_id={file_id}, path={file_path}, name={file_name}")
-
-        file_url = f"https://api.telegram.org/file/bot{os.getenv('SECRET_KEY')}/{file_path}"
-        status_message = await message.answer("⏳ Загрузка файла...")
-
-        try:
-            relative_path = await download_file(file_url, file_name)
-
-            await save_file_to_post(
-                shop["id"],
-                relative_path,
-                latitude=location["latitude"],
-                longitude=location["longitude"],
-                type_photo=type_photo,
+        queue_position = upload_ticket.position
+        if queue_position:
+            await bot.edit_message_text(
+                f"⏳ Пожалуйста, подождите, вы №{queue_position} в очереди...",
+                chat_id=status_message.chat.id,
+                message_id=status_message.message_id,
             )
 
-            logger.info(f"Файл сохранен: {file_name} для магазина {shop['shop_name']}")
+        results = await asyncio.gather(
+            *(
+                upload_document(bot, document, shop, location, type_photo, upload_ticket)
+                for document in documents
+            ),
+            return_exceptions=True,
+        )
+        errors = [result for result in results if isinstance(result, Exception)]
+        for error in errors:
+            logger.error("Ошибка при сохранении файла от %s: %s", telegram_id, error, exc_info=error)
 
-            await state.update_data(location=None, type_photo=None)
-            await state.set_state(UserState.authorized)
+        saved = len(documents) - len(errors)
+        if saved:
+            await state.update_data(location=None, type_photo=None, shop=None)
+        await state.set_state(UserState.authorized)
 
-            await bot.edit_message_text(
-                f"✅ Файл успешно сохранен и связан с магазином '{shop['shop_name']}'.",
-                chat_id=status_message.chat.id,
-                message_id=status_message.message_id,
+        if len(documents) == 1:
+            text = (
+                get_upload_error_text(str(errors[0]))
+                if errors
+                else f"✅ Файл успешно сохранен и связан с магазином '{shop['shop_name']}'."
             )
+        else:
+            mark = "✅" if saved else "❌"
+            text = f"{mark} Сохранено файлов: {saved} из {len(documents)} для магазина '{shop['shop_name']}'."
+            if errors:
+                text += "\n\n" + "\n".join(sorted({get_upload_error_text(str(error)) for error in errors}))
+
+        await bot.edit_message_text(
+            text,
+            chat_id=status_message.chat.id,
+            message_id=status_message.message_id,
+        )
 
+        if saved:
             await message.answer(
                 text='Хотите загрузить еще фото?',
                 reply_markup=get_main_keyboard()
             )
 
-        except Exception as e:
-            await state.set_state(UserState.authorized)
-            error_message = str(e)
-            logger.exception(f"Ошибка при сохранении файла от {telegram_id}: {error_message}")
-
-            if "более 5 минут назад" in error_message:
-                await bot.edit_message_text(
-                    "❌ Фото сделано более 5 минут назад. Пожалуйста, сделайте свежее фото.",
-                    chat_id=status_message.chat.id,
-                    message_id=status_message.message_id,
-                )
-            elif "EXIF данные отсутствуют" in error_message or "метаданные отсутствуют" in error_message.lower():
-                await bot.edit_message_text(
-                    "❌ Фото не содержит необходимые метаданные (EXIF). Пожалуйста, сделайте фото через камеру телефона.",
-                    chat_id=status_message.chat.id,
-                    message_id=status_message.message_id,
-                )
-            else:
-                await bot.edit_message_text(
-                    "❌ Ошибка при сохранении файла.",
-                    chat_id=status_message.chat.id,
-                    message_id=status_message.message_id,
-                )
-
     except Exception as e:
         await state.set_state(UserState.authorized)
-        logger.exception(f"Ошибка в handle_file от {telegram_id}: {str(e)}")
+        logger.exception("Ошибка в handle_file от %s: %s", telegram_id, e)
         await message.answer("❗ Неизвестная ошибка.")
 
 
@@ -288,15 +367,12 @@ async def back_from_photo(message: Message, state: FSMContext):
     )
 
 
-@router.callback_query(lambda c: c.data in ["payment_yes", "payment_no"])
-async def handle_payment_callback(callback_query):
+@router.callback_query(lambda c: c.data in ["payment_yes", "payment_no"], flags={"shop": True})
+async def handle_payment_callback(callback_query, shop):
     callback_data = callback_query.data
     user_chat_id = callback_query.from_user.id
-    user = await get_user_profile(user_chat_id)
 
     try:
-        shop = await get_shop_by_phone(user["phone_number"])
-
         if callback_data == "payment_yes":
             answer = "Да"
             response_text = "✅ Спасибо! Ваш ответ записан: получили оплату"
@@ -309,7 +385,11 @@ async def handle_payment_callback(callback_query):
         current_year = now.year
         await save_report(shop["id"], answer)
         logger.info(
-            f"Создан новый отчет для магазина {shop['shop_name']} за {current_month}/{current_year}: {answer}"
+            "Создан новый отчет для магазина %s за %s/%s: %s",
+            shop["shop_name"],
+            current_month,
+            current_year,
+            answer,
         )
 
         await callback_query.message.edit_text(text=response_text, reply_markup=None)
@@ -317,7 +397,7 @@ async def handle_payment_callback(callback_query):
 
     except Exception as e:
         await callback_query.answer("Произошла ошибка при записи ответа")
-        logger.error(f"Ошибка при обработке ответа от {user_chat_id}: {e}")
+        logger.error("Ошибка при обработке ответа от %s: %s", user_chat_id, e)
 
 
 @router.message(UserState.unauthorized)
@@ -360,12 +440,11 @@ async def handle_authorized_commands(message: Message, state: FSMContext):
     )
 
 
-@router.message()
-async def unknown_message(message: Message, state: FSMContext):
+@router.message(flags={"profile": True})
+async def unknown_message(message: Message, state: FSMContext, user_profile: dict | None):
     current_state = await state.get_state()
-    user = await get_user_profile(message.from_user.id)
 
-    if not user:
+    if not user_profile:
         await message.answer(
             "Для начала работы, пожалуйста, поделитесь своим контактом.",
             reply_markup=get_contact_keyboard(),
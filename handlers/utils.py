@@ -1,42 +1,153 @@
 import asyncio
-import json
 import os
 import re
+import shutil
 import subprocess
-import uuid
 from datetime import datetime, timedelta
+from functools import cache
 from typing import Any
-import pillow_heif
+
 import aiohttp
-import piexif
-import pytz
-from asgiref.sync import sync_to_async
-from PIL import Image
 
-from config.redis_connect import redis_client
+from config.redis_connect import get_redis
 from services.logger import logger
+from services.serialization import dumps, loads
+from services.staging import get_staging
+
+SHOP_REQUEST_TIMEOUT = aiohttp.ClientTimeout(total=10)
+POST_REQUEST_TIMEOUT = aiohttp.ClientTimeout(total=60)
+
+
+@cache
+def load_image_stack():
+    # Pillow, piexif, pillow-heif и pytz загружаются при первом обращении, а не при импорте модуля
+    import piexif
+    import pytz
+    from PIL import Image
+
+    try:
+        import pillow_heif
+
+        pillow_heif.register_heif_opener()
+    except ImportError:
+        logger.warning("pillow-heif не установлен, HEIC будет конвертироваться через ImageMagick")
+    return Image, piexif, pytz
 
 
 async def save_report(shop_id, ans):
     api_url = f"{os.getenv('WEB_SERVICE_URL')}/api/reports/"
     try:
-        async with aiohttp.ClientSession() as session:
+        async with aiohttp.ClientSession(json_serialize=dumps) as session:
             async with session.post(api_url, json={"shop": shop_id, "answer": ans}) as response:
                 if response.status == 201:
-                    await response.json()
+                    await response.json(loads=loads)
                     return
                 else:
-                    logger.error(f"API request failed with status {response.status}")
+                    logger.error("API request failed with status %s", response.status)
                     return None
 
     except Exception:
         return None
 
 
+PROFILE_FIELDS = ("phone_number",)
+
+
+def user_profile_key(telegram_id: int) -> str:
+    return f"user:{telegram_id}"
+
+
+async def store_user_profile(telegram_id: int, profile: dict[str, Any]):
+    key = user_profile_key(telegram_id)
+    async with get_redis().pipeline(transaction=True) as pipe:
+        pipe.delete(key)
+        pipe.hset(key, mapping=profile)
+        await pipe.execute()
+
+
+async def get_user_profiles(telegram_ids: list[int]) -> dict[int, dict[str, Any] | None]:
+    from redis.exceptions import ResponseError
+
+    redis = get_redis()
+    async with redis.pipeline(transaction=False) as pipe:
+        for telegram_id in telegram_ids:
+            pipe.hmget(user_profile_key(telegram_id), PROFILE_FIELDS)
+        results = await pipe.execute(raise_on_error=False)
+
+    profiles: dict[int, dict[str, Any] | None] = dict.fromkeys(telegram_ids)
+    legacy_ids = []
+    for telegram_id, result in zip(telegram_ids, results):
+        if isinstance(result, ResponseError):
+            # WRONGTYPE: профиль еще хранится JSON-строкой
+            legacy_ids.append(telegram_id)
+        elif isinstance(result, Exception):
+            raise result
+        else:
+            profile = {field: value for field, value in zip(PROFILE_FIELDS, result) if value is not None}
+            profiles[telegram_id] = profile or None
+
+    if legacy_ids:
+        values = await redis.mget([user_profile_key(telegram_id) for telegram_id in legacy_ids])
+        for telegram_id, value in zip(legacy_ids, values):
+            profiles[telegram_id] = loads(value) if value else None
+            if profiles[telegram_id]:
+                await store_user_profile(telegram_id, profiles[telegram_id])
+
+    return profiles
+
+
 async def get_user_profile(telegram_id: int) -> dict[str, Any] | None:
-    key = f"user:{telegram_id}"
-    data = await redis_client.get(key)
-    return json.loads(data) if data else None
+    profiles = await get_user_profiles([telegram_id])
+    return profiles[telegram_id]
+
+
+async def migrate_user_profile_batch(redis, keys: list[str]) -> tuple[int, int]:
+    async with redis.pipeline(transaction=False) as pipe:
+        for key in keys:
+            pipe.type(key)
+        types = await pipe.execute()
+
+    legacy_keys = [key for key, key_type in zip(keys, types) if key_type == "string"]
+    if not legacy_keys:
+        return 0, 0
+
+    migrated = skipped = 0
+    values = await redis.mget(legacy_keys)
+    async with redis.pipeline(transaction=True) as pipe:
+        for key, value in zip(legacy_keys, values):
+            if not value:
+                continue
+            try:
+                profile = loads(value)
+            except ValueError:
+                profile = None
+            if not isinstance(profile, dict) or not profile:
+                logger.warning("Пропущен профиль %s с некорректным значением: %r", key, value[:100])
+                skipped += 1
+                continue
+            pipe.delete(key)
+            pipe.hset(key, mapping=profile)
+            migrated += 1
+        await pipe.execute()
+    return migrated, skipped
+
+
+async def migrate_user_profiles(batch_size: int = 500) -> int:
+    redis = get_redis()
+    migrated = skipped = 0
+    cursor = 0
+    while True:
+        # Каждая страница SCAN переносится сразу, без сбора всех ключей в память
+        cursor, keys = await redis.scan(cursor, match="user:*", count=batch_size)
+        if keys:
+            batch_migrated, batch_skipped = await migrate_user_profile_batch(redis, keys)
+            migrated += batch_migrated
+            skipped += batch_skipped
+        if not cursor:
+            break
+
+    logger.info("Профилей перенесено в hash: %s, пропущено: %s", migrated, skipped)
+    return migrated
 
 
 async def get_shop_by_phone(phone_number: str):
@@ -44,61 +155,61 @@ async def get_shop_by_phone(phone_number: str):
         phone_number = "+" + phone_number
     api_url = f"{os.getenv('WEB_SERVICE_URL')}/api/shops/{phone_number}"
     try:
-        async with aiohttp.ClientSession() as session:
+        async with aiohttp.ClientSession(json_serialize=dumps, timeout=SHOP_REQUEST_TIMEOUT) as session:
             async with session.get(api_url) as response:
                 if response.status == 200:
-                    data = await response.json()
+                    data = await response.json(loads=loads)
                     return data
                 else:
-                    logger.error(f"API request failed with status {response.status}")
+                    logger.error("API request failed with status %s", response.status)
                     return []
     except Exception as e:
-        logger.error(f"Error in get_shop_by_phone: {e}")
+        logger.error("Error in get_shop_by_phone: %s", e)
         return None
 
 
 async def save_user_profile(telegram_id: int, phone_number: str) -> bool:
     if not phone_number.startswith("+"):
         phone_number = "+" + phone_number
-    key = f"user:{telegram_id}"
     user_data = {"phone_number": phone_number}
-    await redis_client.set(key, json.dumps(user_data))
+    await store_user_profile(telegram_id, user_data)
     try:
         api_url = f"{os.getenv('WEB_SERVICE_URL')}/api/telephones-get/{phone_number}/"
-        async with aiohttp.ClientSession() as session:
+        async with aiohttp.ClientSession(json_serialize=dumps) as session:
             async with session.get(api_url) as response:
                 if response.status == 200:
-                    data = await response.json()
+                    data = await response.json(loads=loads)
                     if "id" in data:
                         id = data["id"]
                         api_url = f"{os.getenv('WEB_SERVICE_URL')}/api/telephones/{id}/"
                         update_data = {"chat_id": telegram_id}
                         async with session.patch(api_url, json=update_data) as update_response:
                             if update_response.status == 200:
-                                logger.info(f"Successfully updated telegram_id for phone {phone_number}")
+                                logger.info("Successfully updated telegram_id for phone %s", phone_number)
                                 return True
                             else:
-                                logger.error(f"Failed to update telegram_id. Status: {update_response.status}")
+                                logger.error("Failed to update telegram_id. Status: %s", update_response.status)
                                 return False
                     return False
                 else:
-                    logger.error(f"API request failed with status {response.status}")
+                    logger.error("API request failed with status %s", response.status)
                     return False
 
     except Exception as e:
-        logger.error(f"Error saving user profile to Redis: {e}")
+        logger.error("Error saving user profile to Redis: %s", e)
         return False
 
 
 def check_photo_creation_time(file_path):
     try:
         file_extension = os.path.splitext(file_path.lower())[1]
+        Image, piexif, pytz = load_image_stack()
         user_timezone = pytz.timezone('Asia/Bishkek')
 
         if file_extension == ".heic":
             metadata = get_heic_metadata(file_path)
             if not metadata:
-                logger.warning(f"Метаданные отсутствуют в HEIC файле: {file_path}")
+                logger.warning("Метаданные отсутствуют в HEIC файле: %s", file_path)
                 return False
 
             date_time_str = None
@@ -108,12 +219,12 @@ def check_photo_creation_time(file_path):
                     break
 
             if not date_time_str:
-                logger.warning(f"Данные о времени создания отсутствуют в HEIC: {file_path}")
+                logger.warning("Данные о времени создания отсутствуют в HEIC: %s", file_path)
                 return False
 
             match = re.match(r"(\d{4}):(\d{2}):(\d{2}) (\d{2}):(\d{2}):(\d{2})", date_time_str)
             if not match:
-                logger.warning(f"Неизвестный формат даты в HEIC: {date_time_str}")
+                logger.warning("Неизвестный формат даты в HEIC: %s", date_time_str)
                 return False
 
             year, month, day, hour, minute, second = map(int, match.groups())
@@ -131,7 +242,7 @@ def check_photo_creation_time(file_path):
                 img = Image.open(file_path)
 
                 if not hasattr(img, "_getexif") or not img._getexif():
-                    logger.warning(f"EXIF данные отсутствуют в изображении: {file_path}")
+                    logger.warning("EXIF данные отсутствуют в изображении: %s", file_path)
                     return False
 
                 exif_dict = piexif.load(img.info["exif"])
@@ -147,15 +258,15 @@ def check_photo_creation_time(file_path):
 
                     return time_diff <= timedelta(minutes=5)
                 else:
-                    logger.warning(f"Данные о времени создания отсутствуют в EXIF: {file_path}")
+                    logger.warning("Данные о времени создания отсутствуют в EXIF: %s", file_path)
                     return False
 
             except Exception as e:
-                logger.warning(f"Ошибка при чтении EXIF данных: {e}")
+                logger.warning("Ошибка при чтении EXIF данных: %s", e)
                 return False
 
     except Exception as e:
-        logger.error(f"Ошибка при проверке времени создания файла: {e}")
+        logger.error("Ошибка при проверке времени создания файла: %s", e)
         return False
 
 
@@ -174,40 +285,58 @@ def get_heic_metadata(file_path):
         )
 
         if result.returncode != 0:
-            logger.error(f"Ошибка при выполнении exiftool: {result.stderr}")
+            logger.error("Ошибка при выполнении exiftool: %s", result.stderr)
             return None
 
-        metadata = json.loads(result.stdout)
+        metadata = loads(result.stdout)
         if not metadata or len(metadata) == 0:
             return None
 
         return metadata[0]
     except Exception as e:
-        logger.error(f"Ошибка при чтении метаданных HEIC: {e}")
+        logger.error("Ошибка при чтении метаданных HEIC: %s", e)
         return None
 
 
-async def download_file(file_url: str, filename: str):
+def link_local_file(source_path: str, save_path: str):
+    try:
+        os.link(source_path, save_path)
+    except OSError:
+        shutil.copyfile(source_path, save_path)
+
+
+def write_file(save_path: str, content: bytes):
+    with open(save_path, "wb") as f:
+        f.write(content)
+
+
+async def download_file(
+    file_url: str, filename: str, local_path: str | None = None, file_size: int | None = None
+):
+    staging = get_staging()
     try:
-        os.makedirs("media/shelf", exist_ok=True)
         _, ext = os.path.splitext(filename)
-        unique_filename = f"{uuid.uuid4()}{ext}"
-        save_path = f"media/shelf/{unique_filename}"
-        relative_path = f"shelf/{unique_filename}"
+        save_path, relative_path = await asyncio.to_thread(staging.allocate, ext, file_size)
+    except Exception as e:
+        logger.error("Error in download_file: %s", e)
+        raise
 
-        async with aiohttp.ClientSession() as session:
-            async with session.get(file_url) as response:
-                if response.status != 200:
-                    raise Exception(f"Failed to download file: {response.status}")
+    try:
+        if local_path and os.path.exists(local_path):
+            await asyncio.to_thread(link_local_file, local_path, save_path)
+        else:
+            async with aiohttp.ClientSession(json_serialize=dumps) as session:
+                async with session.get(file_url) as response:
+                    if response.status != 200:
+                        raise Exception(f"Failed to download file: {response.status}")
 
-                with open(save_path, "wb") as f:
-                    f.write(await response.read())
+                    await asyncio.to_thread(write_file, save_path, await response.read())
 
         file_extension = os.path.splitext(filename.lower())[1]
         image_extensions = [".jpg", ".jpeg", ".png", ".heic", ".tiff", ".bmp"]
 
         if any(file_extension == ext for ext in image_extensions):
-            is_valid = await sync_to_async(check_photo_creation_time)(save_path)
+            is_valid = await asyncio.to_thread(check_photo_creation_time, save_path)
             if not is_valid:
                 if os.path.exists(save_path):
                     os.remove(save_path)
@@ -215,17 +344,18 @@ async def download_file(file_url: str, filename: str):
 
             if file_extension in ['.heic', '.heif']:
                 new_path = await convert_heic_to_jpeg(save_path)
-                relative_path = f"shelf/{os.path.basename(new_path)}"
+                relative_path = os.path.join(os.path.dirname(relative_path), os.path.basename(new_path))
 
         return relative_path
     except Exception as e:
-        logger.error(f"Error in download_file: {e}")
+        logger.error("Error in download_file: %s", e)
+        await asyncio.to_thread(staging.release, relative_path)
         raise
 
 
 async def get_address_from_coordinates(latitude, longitude):
     try:
-        async with aiohttp.ClientSession() as session:
+        async with aiohttp.ClientSession(json_serialize=dumps) as session:
             async with session.get(
                 "https://nominatim.openstreetmap.org/reverse",
                 params={
@@ -236,11 +366,11 @@ async def get_address_from_coordinates(latitude, longitude):
                 headers={"User-Agent": "DjangoApp"},
             ) as response:
                 if response.status == 200:
-                    data = await response.json()
+                    data = await response.json(loads=loads)
                     return data.get("display_name")
         return None
     except Exception as e:
-        logger.error(f"Error in get_address_from_coordinates: {e}")
+        logger.error("Error in get_address_from_coordinates: %s", e)
         return None
 
 
@@ -250,10 +380,10 @@ async def save_file_to_post(shop_id, relative_path, latitude=None, longitude=Non
         api_url = f"{os.getenv('WEB_SERVICE_URL')}/api/shop-posts/create/"
         data = {"shop_id": shop_id, "latitude": latitude, "longitude": longitude, "post_type": type_photo}
 
-        logger.info(f"Отправка файла: {file_path}")
-        logger.info(f"Данные: {data}")
+        logger.info("Отправка файла: %s", file_path)
+        logger.debug("Данные: %s", data)
 
-        async with aiohttp.ClientSession() as session:
+        async with aiohttp.ClientSession(json_serialize=dumps, timeout=POST_REQUEST_TIMEOUT) as session:
             with open(file_path, "rb") as image_file:
                 form_data = aiohttp.FormData()
                 for key, value in data.items():
@@ -265,24 +395,26 @@ async def save_file_to_post(shop_id, relative_path, latitude=None, longitude=Non
                 async with session.post(api_url, data=form_data) as response:
                     response_text = await response.text()
 
-                    # Очистка файла
-                    if os.path.exists(file_path):
-                        os.remove(file_path)
-
                     if response.status == 201:
                         logger.info("Файл успешно загружен")
-                        return {"success": True, "data": json.loads(response_text) if response_text else None}
+                        return {"success": True, "data": loads(response_text) if response_text else None}
                     else:
-                        logger.error(f"Ошибка при создании поста. Статус: {response.status}, Ответ: {response_text}")
+                        logger.error(
+                            "Ошибка при создании поста. Статус: %s, Ответ: %s", response.status, response_text
+                        )
                         return {"success": False, "status": response.status, "error": response_text}
 
     except Exception as e:
-        logger.error(f"Ошибка в save_file_to_post: {e}")
-        if os.path.exists(file_path):
-            os.remove(file_path)
+        logger.error("Ошибка в save_file_to_post: %s", e)
         return {"success": False, "error": str(e)}
 
 
+def convert_heic_with_pillow(heic_path, jpeg_path):
+    Image, _, _ = load_image_stack()
+    with Image.open(heic_path) as img:
+        img.convert('RGB').save(jpeg_path, 'JPEG', quality=95, optimize=True)
+
+
 async def convert_heic_to_jpeg(heic_path):
     try:
         if not heic_path.lower().endswith(('.heic', '.heif')):
@@ -291,14 +423,12 @@ async def convert_heic_to_jpeg(heic_path):
         jpeg_path = os.path.splitext(heic_path)[0] + '.jpg'
 
         try:
-            pillow_heif.register_heif_opener()
-            with Image.open(heic_path) as img:
-                img.convert('RGB').save(jpeg_path, 'JPEG', quality=95, optimize=True)
+            await asyncio.to_thread(convert_heic_with_pillow, heic_path, jpeg_path)
 
-            logger.info(f"HEIC конвертирован через pillow-heif: {heic_path} -> {jpeg_path}")
+            logger.info("HEIC конвертирован через pillow-heif: %s -> %s", heic_path, jpeg_path)
 
         except (ImportError, Exception) as e:
-            logger.warning(f"Pillow-heif не сработал: {e}. Пробуем ImageMagick...")
+            logger.warning("Pillow-heif не сработал: %s. Пробуем ImageMagick...", e)
 
             cmd = ['convert', heic_path, jpeg_path]
 
@@ -322,10 +452,10 @@ async def convert_heic_to_jpeg(heic_path):
 
         if os.path.exists(heic_path):
             os.remove(heic_path)
-            logger.info(f"Удален оригинальный HEIC файл: {heic_path}")
+            logger.info("Удален оригинальный HEIC файл: %s", heic_path)
 
         return jpeg_path
 
     except Exception as e:
-        logger.error(f"Ошибка в convert_heic_to_jpeg: {e}")
+        logger.error("Ошибка в convert_heic_to_jpeg: %s", e)
         raise
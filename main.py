@@ -1,40 +1,280 @@
 import asyncio
+import multiprocessing
+import os
+import signal
+from pathlib import Path
 
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import BareFilesPathWrapper, SimpleFilesPathWrapper, TelegramAPIServer
 from aiogram.enums import ParseMode
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
 
-from config.config import load_config
+from config.config import get_config
+from config.redis_connect import get_redis
 from handlers.user_handlers import router as user_router
+from handlers.utils import load_image_stack, save_file_to_post
 from keyboards.menu import set_menu
+from middlewares.album import AlbumMiddleware
+from middlewares.capture import TrafficCaptureMiddleware
+from middlewares.lanes import PriorityLaneMiddleware
+from middlewares.throttling import ThrottlingMiddleware, UploadLimiter
+from middlewares.user_profile import ShopMiddleware, UserProfileMiddleware
 from services.logger import logger
+from services.loop_monitor import LoopMonitor, start_metrics_server
 from services.notifaction import setup_scheduler
+from services.serialization import describe_runtime, dumps, get_loop_factory, loads
+from services.sharding import shard_for_update, update_queue_key
+from services.staging import get_staging
 
-config = load_config()
+WORKER_DRAIN_TIMEOUT = 60
 
 
-async def main():
-    logger.info("Starting bot")
+def create_session() -> AiohttpSession:
+    config = get_config()
+    if not config.tg_bot.api_url:
+        return AiohttpSession(json_loads=loads, json_dumps=dumps)
+
+    wrap_local_file = BareFilesPathWrapper()
+    if config.tg_bot.api_files_path and config.tg_bot.local_files_path:
+        wrap_local_file = SimpleFilesPathWrapper(
+            server_path=Path(config.tg_bot.api_files_path),
+            local_path=Path(config.tg_bot.local_files_path),
+        )
+
+    logger.info("Используется Bot API сервер: %s (local=%s)", config.tg_bot.api_url, config.tg_bot.local_api)
+    return AiohttpSession(
+        api=TelegramAPIServer.from_base(
+            config.tg_bot.api_url,
+            is_local=config.tg_bot.local_api,
+            wrap_local_file=wrap_local_file,
+        ),
+        json_loads=loads,
+        json_dumps=dumps,
+    )
 
-    bot = Bot(
+
+def create_bot() -> Bot:
+    config = get_config()
+    return Bot(
         token=config.tg_bot.token,
+        session=create_session(),
         default=DefaultBotProperties(parse_mode=ParseMode.HTML),
     )
-    await set_menu(bot)
+
+
+def log_warm_up_result(future: asyncio.Future):
+    if not future.cancelled() and future.exception():
+        logger.error("Не удалось загрузить библиотеки обработки изображений: %s", future.exception())
+
+
+def log_recovery_result(task: asyncio.Task):
+    if not task.cancelled() and task.exception():
+        logger.error("Ошибка при восстановлении временных файлов: %s", task.exception())
+
+
+def start_recovery(staging) -> asyncio.Task:
+    # Дозагрузка идет в фоне: пока веб-сервис недоступен, бот все равно отвечает пользователям
+    task = asyncio.create_task(staging.recover(save_file_to_post))
+    task.add_done_callback(log_recovery_result)
+    return task
+
+
+async def warm_up_image_stack():
+    # Прогрев Pillow в фоне, чтобы не задерживать старт поллинга и не платить за импорт на первом фото
+    future = asyncio.get_running_loop().run_in_executor(None, load_image_stack)
+    future.add_done_callback(log_warm_up_result)
+
+
+def create_dispatcher() -> Dispatcher:
+    config = get_config()
     dp = Dispatcher()
+    dp.startup.register(warm_up_image_stack)
+    if config.capture.directory:
+        dp.update.outer_middleware(TrafficCaptureMiddleware(config.capture.directory))
+    lanes = PriorityLaneMiddleware(interactive_limit=config.throttling.interactive_concurrency)
+    dp.message.outer_middleware(AlbumMiddleware())
+    dp.message.outer_middleware(lanes)
+    dp.callback_query.outer_middleware(lanes)
+    workers = config.workers.count
+    dp.message.middleware(
+        ThrottlingMiddleware(
+            UploadLimiter(
+                max_concurrent=max(1, config.throttling.max_concurrent_uploads // workers),
+                max_per_user=config.throttling.max_uploads_per_user,
+                max_queue=max(1, config.throttling.max_upload_queue // workers),
+                interactive_idle=lanes.interactive_idle,
+            )
+        )
+    )
+    dp.message.middleware(UserProfileMiddleware())
+    dp.message.middleware(ShopMiddleware())
+    dp.callback_query.middleware(UserProfileMiddleware())
+    dp.callback_query.middleware(ShopMiddleware())
     dp.include_router(user_router)
+    return dp
+
+
+async def start_loop_monitor(metrics_port_offset: int = 0):
+    config = get_config()
+    monitor = LoopMonitor(
+        interval=config.monitoring.loop_monitor_interval,
+        threshold=config.monitoring.loop_lag_threshold,
+    )
+    monitor.start()
+    metrics_runner = None
+    if config.monitoring.metrics_port:
+        metrics_runner = await start_metrics_server(monitor, config.monitoring.metrics_port + metrics_port_offset)
+    return monitor, metrics_runner
+
+
+async def stop_loop_monitor(monitor: LoopMonitor, metrics_runner):
+    if metrics_runner:
+        await metrics_runner.cleanup()
+    await monitor.stop()
+
+
+async def run_worker(index: int):
+    config = get_config()
+    monitor, metrics_runner = await start_loop_monitor(metrics_port_offset=index + 1)
+
+    # Файлы, которые воркер не успел отправить до падения, дозагружаются при его перезапуске
+    staging = get_staging()
+    recovery = start_recovery(staging)
+    scheduler = AsyncIOScheduler()
+    scheduler.add_job(staging.cleanup, "interval", seconds=config.staging.cleanup_interval)
+    scheduler.start()
+
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stopping.set)
+
+    bot = create_bot()
+    dp = create_dispatcher()
+    queue = update_queue_key(index)
+    tasks: set[asyncio.Task] = set()
+    logger.info("Воркер %s слушает очередь %s", index, queue)
+    await warm_up_image_stack()
+
+    try:
+        while not stopping.is_set():
+            item = await get_redis().blpop([queue], timeout=1)
+            if item is None:
+                continue
+            task = asyncio.create_task(dp.feed_raw_update(bot, loads(item[1])))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        # Новые апдейты остаются в очереди Redis, а уже взятые в работу дообрабатываются
+        if tasks:
+            logger.info("Воркер %s завершает обработку %s апдейтов", index, len(tasks))
+            await asyncio.wait(tasks, timeout=WORKER_DRAIN_TIMEOUT)
+    finally:
+        recovery.cancel()
+        scheduler.shutdown(wait=False)
+        await bot.session.close()
+        await stop_loop_monitor(monitor, metrics_runner)
+        logger.info("Воркер %s остановлен", index)
+
+
+def worker_entry(index: int):
+    os.environ["BOT_WORKER_INDEX"] = str(index)
+    try:
+        asyncio.run(run_worker(index), loop_factory=get_loop_factory())
+    except KeyboardInterrupt:
+        pass
+
+
+def start_worker(index: int) -> multiprocessing.Process:
+    process = multiprocessing.get_context("spawn").Process(
+        target=worker_entry, args=(index,), name=f"bot-worker-{index}", daemon=True
+    )
+    process.start()
+    return process
+
+
+async def run_supervisor(bot: Bot, workers: int):
+    supervisor = asyncio.current_task()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, supervisor.cancel)
+
+    processes = [start_worker(index) for index in range(workers)]
+    offset = None
+
+    try:
+        while True:
+            for index, process in enumerate(processes):
+                if not process.is_alive():
+                    logger.warning("Воркер %s завершился с кодом %s, перезапускаем", index, process.exitcode)
+                    processes[index] = start_worker(index)
+
+            try:
+                updates = await bot.get_updates(offset=offset, timeout=30, request_timeout=40)
+            except Exception as e:
+                logger.error("Ошибка при получении обновлений: %s", e)
+                await asyncio.sleep(1)
+                continue
+
+            if not updates:
+                continue
+
+            try:
+                async with get_redis().pipeline(transaction=False) as pipe:
+                    for update in updates:
+                        raw = update.model_dump(mode="json", by_alias=True, exclude_none=True)
+                        pipe.rpush(update_queue_key(shard_for_update(raw, workers)), dumps(raw))
+                    await pipe.execute()
+            except Exception as e:
+                # offset не сдвигаем: Telegram отдаст те же обновления при следующем запросе
+                logger.error("Ошибка при передаче обновлений воркерам: %s", e)
+                await asyncio.sleep(1)
+                continue
+            offset = updates[-1].update_id + 1
+    except asyncio.CancelledError:
+        logger.info("Получен сигнал остановки, завершаем воркеры")
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join(WORKER_DRAIN_TIMEOUT + 10)
+            if process.is_alive():
+                logger.warning("Воркер %s не завершился вовремя, останавливаем принудительно", process.name)
+                process.kill()
+                process.join()
+
+
+async def main():
+    config = get_config()
+    logger.info("Starting bot (runtime: %s)", describe_runtime())
+    monitor, metrics_runner = await start_loop_monitor()
+
+    staging = get_staging()
+    recovery = start_recovery(staging)
+
+    bot = create_bot()
+    await set_menu(bot)
     scheduler = setup_scheduler(bot)
+    scheduler.add_job(staging.cleanup, "interval", seconds=config.staging.cleanup_interval)
     scheduler.start()
     try:
         logger.info("Bot is starting")
         await bot.delete_webhook(drop_pending_updates=True)
-        await dp.start_polling(bot)
+        if config.workers.count > 1:
+            logger.info("Запуск в режиме супервизора: %s воркеров", config.workers.count)
+            await run_supervisor(bot, config.workers.count)
+        else:
+            await create_dispatcher().start_polling(bot)
     except Exception as e:
-        logger.error(f"Critical error: {e}")
+        logger.error("Critical error: %s", e)
     finally:
+        recovery.cancel()
         logger.info("Bot stopped")
         await bot.session.close()
+        await stop_loop_monitor(monitor, metrics_runner)
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    asyncio.run(main(), loop_factory=get_loop_factory())
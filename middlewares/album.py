@@ -0,0 +1,42 @@
+import asyncio
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import Message
+
+ALBUM_LATENCY = 0.6
+
+
+class AlbumMiddleware(BaseMiddleware):
+    def __init__(self, latency: float = ALBUM_LATENCY):
+        self.latency = latency
+        self.albums: dict[str, list[Message]] = {}
+
+    async def __call__(
+        self,
+        handler: Callable[[Message, dict[str, Any]], Awaitable[Any]],
+        event: Message,
+        data: dict[str, Any],
+    ) -> Any:
+        if not event.media_group_id:
+            return await handler(event, data)
+
+        album = self.albums.get(event.media_group_id)
+        if album is not None:
+            album.append(event)
+            return None
+
+        album = self.albums[event.media_group_id] = [event]
+        try:
+            # Ждем, пока Telegram перестанет присылать сообщения этой группы
+            while True:
+                size = len(album)
+                await asyncio.sleep(self.latency)
+                if len(album) == size:
+                    break
+        finally:
+            del self.albums[event.media_group_id]
+
+        album.sort(key=lambda m: m.message_id)
+        data["album"] = album
+        return await handler(album[0], data)
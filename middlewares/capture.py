@@ -0,0 +1,135 @@
+import atexit
+import gzip
+import hashlib
+import os
+import queue
+import secrets
+import threading
+import time
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import Update
+
+from keyboards.keyboards import (
+    get_contact_keyboard,
+    get_location_keyboard,
+    get_main_keyboard,
+    get_photo_keyboard,
+    get_photo_type_keyboard,
+)
+from services.logger import logger
+from services.serialization import dumps
+
+ID_FIELDS = {"id", "user_id", "chat_id", "sender_chat_id"}
+FILE_ID_FIELDS = {"file_id", "file_unique_id"}
+PERSONAL_FIELDS = {"first_name", "last_name", "username", "title", "bio", "vcard"}
+FREE_TEXT_FIELDS = {"text", "caption"}
+DROPPED_FIELDS = {"entities", "caption_entities", "reply_to_message", "quote"}
+# Центр Бишкека вместо реальных координат магазинов
+PLACEHOLDER_LOCATION = {"latitude": 42.8746, "longitude": 74.5698}
+STOP = object()
+
+
+def get_known_texts() -> set[str]:
+    keyboards = (
+        get_main_keyboard(),
+        get_contact_keyboard(),
+        get_location_keyboard(),
+        get_photo_keyboard(),
+        get_photo_type_keyboard(),
+    )
+    return {button.text for keyboard in keyboards for row in keyboard.keyboard for button in row}
+
+
+class UpdateAnonymizer:
+    # Идентификаторы заменяются стабильными псевдонимами (на время одной записи), чтобы при
+    # воспроизведении сохранялось поведение отдельных пользователей; соль в файл не пишется.
+    def __init__(self):
+        self.salt = secrets.token_bytes(16)
+        self.known_texts = get_known_texts()
+
+    def pseudonym(self, value: Any) -> int:
+        digest = hashlib.blake2b(str(value).encode(), key=self.salt, digest_size=8).digest()
+        pseudonym = int.from_bytes(digest) % 10**12 + 1
+        return -pseudonym if isinstance(value, int) and value < 0 else pseudonym
+
+    def anonymize(self, value: Any, key: str | None = None) -> Any:
+        if isinstance(value, dict):
+            if key == "location":
+                return {**value, **PLACEHOLDER_LOCATION}
+            return {
+                field: self.anonymize(item, field) for field, item in value.items() if field not in DROPPED_FIELDS
+            }
+        if isinstance(value, list):
+            return [self.anonymize(item, key) for item in value]
+        if key in ID_FIELDS and isinstance(value, int):
+            return self.pseudonym(value)
+        if key in FILE_ID_FIELDS:
+            return f"file{self.pseudonym(value)}"
+        if key == "phone_number":
+            return f"+996{self.pseudonym(value) % 10**9:09d}"
+        if key == "file_name":
+            return f"file{os.path.splitext(value)[1].lower()}"
+        if key in PERSONAL_FIELDS:
+            return "user"
+        if key in FREE_TEXT_FIELDS and isinstance(value, str):
+            if value in self.known_texts:
+                return value
+            if value.startswith("/"):
+                return value.split()[0]
+            return "x" * len(value)
+        return value
+
+
+class TrafficCaptureMiddleware(BaseMiddleware):
+    def __init__(self, directory: str, flush_interval: float = 5.0):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f"updates-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.jsonl.gz")
+        self.flush_interval = flush_interval
+        self.anonymizer = UpdateAnonymizer()
+        self._started = time.monotonic()
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._writer = threading.Thread(target=self._write, name="traffic-capture", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+        logger.info("Запись входящих обновлений в %s", self.path)
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: dict[str, Any],
+    ) -> Any:
+        # Сериализация и анонимизация выполняются в потоке записи, здесь только постановка в очередь
+        self._queue.put((time.monotonic() - self._started, time.time(), event))
+        return await handler(event, data)
+
+    def close(self):
+        if self._writer.is_alive():
+            self._queue.put(STOP)
+            self._writer.join()
+
+    def _write(self):
+        with gzip.open(self.path, "at", encoding="utf-8") as f:
+            last_flush = time.monotonic()
+            while True:
+                try:
+                    item = self._queue.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    item = None
+                if item is STOP:
+                    break
+                if item is not None:
+                    self._write_record(f, *item)
+                if time.monotonic() - last_flush >= self.flush_interval:
+                    f.flush()
+                    last_flush = time.monotonic()
+
+    def _write_record(self, f, offset: float, timestamp: float, update: Update):
+        try:
+            raw = update.model_dump(mode="json", by_alias=True, exclude_none=True)
+            record = {"t": round(offset, 4), "ts": timestamp, "update": self.anonymizer.anonymize(raw)}
+            f.write(dumps(record) + "\n")
+        except Exception as e:
+            logger.error("Ошибка при записи обновления: %s", e)
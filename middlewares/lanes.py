@@ -0,0 +1,52 @@
+import asyncio
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import Message, TelegramObject
+
+INTERACTIVE_LANE = "interactive"
+HEAVY_LANE = "heavy"
+
+
+def get_lane(event: TelegramObject) -> str:
+    if isinstance(event, Message) and (event.document or event.photo or event.video):
+        return HEAVY_LANE
+    return INTERACTIVE_LANE
+
+
+class PriorityLaneMiddleware(BaseMiddleware):
+    # Ограничивает только интерактивную полосу. Тяжелые загрузки проходят сразу, чтобы
+    # ThrottlingMiddleware мог принять их в ограниченную очередь или отклонить. Дальше вся
+    # обработка файла (get_file, скачивание, отправка поста) идет внутри слота UploadLimiter,
+    # который ждет interactive_idle перед каждым файлом.
+    def __init__(self, interactive_limit: int):
+        self.semaphore = asyncio.Semaphore(interactive_limit)
+        self.interactive_pending = 0
+        self.interactive_idle = asyncio.Event()
+        self.interactive_idle.set()
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        if get_lane(event) == HEAVY_LANE:
+            return await handler(event, data)
+
+        self.interactive_pending += 1
+        self.interactive_idle.clear()
+        entered = False
+        try:
+            async with self.semaphore:
+                entered = True
+                self._leave_pending()
+                return await handler(event, data)
+        finally:
+            if not entered:
+                self._leave_pending()
+
+    def _leave_pending(self):
+        self.interactive_pending -= 1
+        if not self.interactive_pending:
+            self.interactive_idle.set()
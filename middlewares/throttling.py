@@ -0,0 +1,106 @@
+import asyncio
+from collections import Counter
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.flags import get_flag
+from aiogram.types import Message
+
+from services.logger import logger
+
+
+class UploadTicket:
+    # Места в очереди, зарезервированные при приеме сообщения: по одному на каждый документ альбома
+    def __init__(self, limiter: "UploadLimiter", reserved: int, position: int):
+        self.limiter = limiter
+        self.reserved = reserved
+        self.position = position
+
+    def heavy_slot(self):
+        return self.limiter.heavy_slot(self)
+
+
+class UploadLimiter:
+    def __init__(
+        self,
+        max_concurrent: int,
+        max_per_user: int,
+        max_queue: int,
+        interactive_idle: asyncio.Event | None = None,
+    ):
+        self.max_concurrent = max_concurrent
+        self.max_per_user = max_per_user
+        self.max_queue = max_queue
+        self.queued = 0
+        self.active = 0
+        self.in_flight: Counter[int] = Counter()
+        self.interactive_idle = interactive_idle
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+
+    def can_queue(self, count: int) -> bool:
+        # Альбом больше max_queue принимается, только если очередь пуста
+        return not self.queued or self.queued + count <= self.max_queue
+
+    def user_limit_reached(self, telegram_id: int) -> bool:
+        return self.in_flight[telegram_id] >= self.max_per_user
+
+    @asynccontextmanager
+    async def admit(self, telegram_id: int, count: int) -> AsyncIterator[UploadTicket]:
+        ahead = self.queued + self.active - self.max_concurrent
+        ticket = UploadTicket(self, count, ahead + 1 if ahead >= 0 else 0)
+        self.queued += count
+        self.in_flight[telegram_id] += 1
+        try:
+            yield ticket
+        finally:
+            self.queued -= ticket.reserved
+            ticket.reserved = 0
+            self.in_flight[telegram_id] -= 1
+            if self.in_flight[telegram_id] <= 0:
+                del self.in_flight[telegram_id]
+
+    @asynccontextmanager
+    async def heavy_slot(self, ticket: UploadTicket) -> AsyncIterator[None]:
+        # Загрузка не стартует, пока есть ожидающие интерактивные обновления
+        if self.interactive_idle is not None:
+            await self.interactive_idle.wait()
+        await self._semaphore.acquire()
+        if ticket.reserved:
+            ticket.reserved -= 1
+            self.queued -= 1
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._semaphore.release()
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    def __init__(self, limiter: UploadLimiter):
+        self.limiter = limiter
+
+    async def __call__(
+        self,
+        handler: Callable[[Message, dict[str, Any]], Awaitable[Any]],
+        event: Message,
+        data: dict[str, Any],
+    ) -> Any:
+        if not get_flag(data, "heavy"):
+            return await handler(event, data)
+
+        telegram_id = event.from_user.id
+        if self.limiter.user_limit_reached(telegram_id):
+            await event.answer("⏳ Дождитесь завершения предыдущей загрузки.")
+            return None
+
+        count = sum(1 for message in data.get("album") or [event] if message.document) or 1
+        if not self.limiter.can_queue(count):
+            logger.warning("Очередь загрузок переполнена, отклонен файл от user_id=%s", telegram_id)
+            await event.answer("⚠️ Сейчас слишком много загрузок. Отправьте фото через несколько минут.")
+            return None
+
+        async with self.limiter.admit(telegram_id, count) as ticket:
+            data["upload_ticket"] = ticket
+            return await handler(event, data)
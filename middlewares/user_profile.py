@@ -0,0 +1,93 @@
+import time
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.flags import get_flag
+from aiogram.types import TelegramObject
+
+from handlers.utils import get_shop_by_phone, get_user_profile
+from services.logger import logger
+
+CACHE_TTL = 30.0
+CACHE_MAX_SIZE = 10_000
+# после сетевой ошибки не ходим в веб-сервис повторно, пока не истечёт пауза
+SHOP_RETRY_AFTER = 10.0
+
+_profile_cache: dict[int, tuple[float, dict[str, Any] | None]] = {}
+_shop_cache: dict[str, tuple[float, Any]] = {}
+
+
+def _remember(cache: dict, key, expires_at: float, value) -> None:
+    cache.pop(key, None)
+    if len(cache) >= CACHE_MAX_SIZE:
+        cache.pop(next(iter(cache)))
+    cache[key] = (expires_at, value)
+
+
+def invalidate_user_context(telegram_id: int) -> None:
+    cached = _profile_cache.pop(telegram_id, None)
+    if cached and cached[1]:
+        _shop_cache.pop(cached[1]["phone_number"], None)
+
+
+async def load_user_profile(telegram_id: int) -> dict[str, Any] | None:
+    cached = _profile_cache.get(telegram_id)
+    now = time.monotonic()
+    if cached and cached[0] > now:
+        return cached[1]
+
+    user_profile = await get_user_profile(telegram_id)
+    _remember(_profile_cache, telegram_id, now + CACHE_TTL, user_profile)
+    return user_profile
+
+
+async def load_shop(phone_number: str) -> Any:
+    cached = _shop_cache.get(phone_number)
+    now = time.monotonic()
+    if cached and cached[0] > now:
+        return cached[1]
+
+    shop = await get_shop_by_phone(phone_number)
+    # None означает сетевую ошибку — кэшируем ненадолго, чтобы не ждать таймаут на каждом апдейте
+    ttl = SHOP_RETRY_AFTER if shop is None else CACHE_TTL
+    _remember(_shop_cache, phone_number, now + ttl, shop)
+    return shop
+
+
+class UserProfileMiddleware(BaseMiddleware):
+    """Загружает профиль из Redis только для хендлеров с флагом profile или shop."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        if user is None or not (get_flag(data, "profile") or get_flag(data, "shop")):
+            return await handler(event, data)
+
+        try:
+            data["user_profile"] = await load_user_profile(user.id)
+        except Exception as e:
+            logger.error("Не удалось загрузить профиль user_id=%s: %s", user.id, e)
+            await event.answer("Произошла ошибка. Пожалуйста, попробуйте позже.")
+            return None
+        return await handler(event, data)
+
+
+class ShopMiddleware(BaseMiddleware):
+    """Загружает магазин только для хендлеров с флагом shop."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        if not get_flag(data, "shop"):
+            return await handler(event, data)
+
+        user_profile = data.get("user_profile")
+        data["shop"] = await load_shop(user_profile["phone_number"]) if user_profile else None
+        return await handler(event, data)
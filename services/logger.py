@@ -1,10 +1,110 @@
+import atexit
+import json
 import logging
+import logging.handlers
+import os
+import queue
+import threading
 import time
 
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(funcName)s - %(message)s",
-    handlers=[logging.StreamHandler()],
-)
-logger = logging.getLogger(__name__)
+LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(funcName)s - %(message)s"
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S") + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "func": record.funcName,
+            "message": record.getMessage(),
+        }
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            payload["suppressed"] = suppressed
+        if record.exc_info:
+            payload["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class RateLimitFilter(logging.Filter):
+    # Не больше `rate` записей одного шаблона за `interval` секунд; остальные отбрасываются
+    # до начала форматирования, а их число добавляется к следующей пропущенной записи.
+    # Записи уровня `exempt_level` и выше не ограничиваются.
+    def __init__(self, rate: int, interval: float, exempt_level: int = logging.WARNING):
+        super().__init__()
+        self.rate = rate
+        self.interval = interval
+        self.exempt_level = exempt_level
+        self._windows: dict[tuple[str, object], list] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= self.exempt_level:
+            return True
+
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                suppressed = window[2] if window else 0
+                self._windows[key] = [now, 1, 0]
+                if suppressed:
+                    record.suppressed = suppressed
+                return True
+            if window[1] < self.rate:
+                window[1] += 1
+                return True
+            window[2] += 1
+            return False
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    # В отличие от стандартного QueueHandler, не форматирует запись в потоке event loop:
+    # msg % args и трейсбек собираются уже в потоке QueueListener.
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def parse_levels(value: str) -> dict[str, str]:
+    levels = {}
+    for item in value.split(","):
+        name, _, level = item.partition("=")
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging() -> logging.handlers.QueueListener:
+    stream_handler = logging.StreamHandler()
+    if os.getenv("LOG_FORMAT", "json").lower() == "json":
+        stream_handler.setFormatter(JsonFormatter())
+    else:
+        stream_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = LazyQueueHandler(log_queue)
+    queue_handler.addFilter(
+        RateLimitFilter(
+            rate=int(os.getenv("LOG_RATE_LIMIT", 20)),
+            interval=float(os.getenv("LOG_RATE_INTERVAL", 1.0)),
+            exempt_level=logging.getLevelName(os.getenv("LOG_RATE_EXEMPT_LEVEL", "WARNING").upper()),
+        )
+    )
+
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+    for name, level in parse_levels(os.getenv("LOG_LEVELS", "")).items():
+        logging.getLogger(name).setLevel(level)
+
+    listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
 logging.Formatter.converter = time.gmtime
+listener = setup_logging()
+logger = logging.getLogger(__name__)
@@ -0,0 +1,113 @@
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+
+from aiohttp import web
+
+from services.logger import logger
+
+
+class BlockingCallError(AssertionError):
+    pass
+
+
+class LoopMonitor:
+    def __init__(self, interval: float = 0.5, threshold: float = 0.1, report_every: float = 60.0):
+        self.interval = interval
+        self.threshold = threshold
+        self.report_every = report_every
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self.stall_count = 0
+        self.stalls: deque[str] = deque(maxlen=20)
+        self._beat = time.monotonic()
+        self._loop_thread_id: int | None = None
+        self._task: asyncio.Task | None = None
+        self._stopped = threading.Event()
+        self._watchdog: threading.Thread | None = None
+
+    def start(self):
+        self._loop_thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._measure())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self):
+        self._stopped.set()
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if self._watchdog:
+            self._watchdog.join()
+
+    def check(self):
+        if self.stalls:
+            raise BlockingCallError(
+                f"Event loop блокировался {self.stall_count} раз(а), последний стек:\n{self.stalls[-1]}"
+            )
+
+    def render_metrics(self) -> str:
+        return (
+            f"bot_event_loop_lag_seconds {self.lag:.6f}\n"
+            f"bot_event_loop_lag_max_seconds {self.max_lag:.6f}\n"
+            f"bot_event_loop_stalls_total {self.stall_count}\n"
+        )
+
+    async def _measure(self):
+        window_started = time.monotonic()
+        window_max = 0.0
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._beat = now
+            self.lag = max(0.0, now - started - self.interval)
+            self.max_lag = max(self.max_lag, self.lag)
+            window_max = max(window_max, self.lag)
+
+            if now - window_started >= self.report_every:
+                logger.info(
+                    "Задержка event loop: текущая %.1f мс, максимум за период %.1f мс, блокировок всего %s",
+                    self.lag * 1000,
+                    window_max * 1000,
+                    self.stall_count,
+                )
+                window_started, window_max = now, 0.0
+
+    def _watch(self):
+        # Сторожевой поток: если сердцебиение из event loop опаздывает больше порога,
+        # значит loop занят синхронным кодом — снимаем его стек прямо во время блокировки.
+        reported_beat = None
+        while not self._stopped.wait(self.threshold / 2):
+            beat = self._beat
+            overdue = time.monotonic() - beat - self.interval
+            if overdue <= self.threshold or beat == reported_beat:
+                continue
+
+            reported_beat = beat
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame else ""
+            self.stall_count += 1
+            self.stalls.append(stack)
+            logger.warning("Event loop заблокирован более %.0f мс:\n%s", overdue * 1000, stack)
+
+
+async def start_metrics_server(monitor: LoopMonitor, port: int) -> web.AppRunner:
+    async def metrics(request: web.Request) -> web.Response:
+        return web.Response(text=monitor.render_metrics())
+
+    app = web.Application()
+    app.router.add_get("/metrics", metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "0.0.0.0", port).start()
+    logger.info("Метрики event loop доступны на :%s/metrics", port)
+    return runner
@@ -2,11 +2,12 @@ import logging
 import os
 
 import aiohttp
-import pytz
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 
+from services.serialization import dumps, loads
+
 logger = logging.getLogger(__name__)
 
 
@@ -14,16 +15,16 @@ async def fetch_owner_telephones():
     api_url = f"{os.getenv('WEB_SERVICE_URL')}/api/telephones/"
 
     try:
-        async with aiohttp.ClientSession() as session:
+        async with aiohttp.ClientSession(json_serialize=dumps) as session:
             async with session.get(api_url) as response:
                 if response.status == 200:
-                    data = await response.json()
+                    data = await response.json(loads=loads)
                     return data
                 else:
-                    logger.error(f"API request failed with status {response.status}")
+                    logger.error("API request failed with status %s", response.status)
                     return []
     except Exception as e:
-        logger.error(f"Error fetching telephones from API: {e}")
+        logger.error("Error fetching telephones from API: %s", e)
         return []
 
 
@@ -61,6 +62,8 @@ async def send_weekly_notification(bot):
 
 
 def setup_scheduler(bot):
+    import pytz
+
     scheduler = AsyncIOScheduler(timezone=pytz.timezone("Asia/Bishkek"))
 
     scheduler.add_job(
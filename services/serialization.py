@@ -0,0 +1,38 @@
+import json
+import os
+from typing import Any
+
+FAST_RUNTIME = os.getenv("FAST_RUNTIME", "false").lower() in ("1", "true", "yes")
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _orjson_dumps(obj: Any) -> str:
+    return orjson.dumps(obj).decode()
+
+
+if FAST_RUNTIME and orjson is not None:
+    dumps = _orjson_dumps
+    loads = orjson.loads
+else:
+    dumps = json.dumps
+    loads = json.loads
+
+
+def get_loop_factory():
+    if not FAST_RUNTIME:
+        return None
+    try:
+        import uvloop
+    except ImportError:
+        return None
+    return uvloop.new_event_loop
+
+
+def describe_runtime() -> str:
+    loop = "uvloop" if get_loop_factory() else "asyncio"
+    serializer = "orjson" if dumps is _orjson_dumps else "json"
+    return f"{loop}+{serializer}"
@@ -0,0 +1,34 @@
+from typing import Any
+
+UPDATE_QUEUE_PREFIX = "updates"
+
+
+def jump_consistent_hash(key: int, num_buckets: int) -> int:
+    # Jump consistent hash (Lamping, Veach): при изменении числа воркеров
+    # переезжает только 1/N пользователей
+    key &= 0xFFFFFFFFFFFFFFFF
+    bucket, j = -1, 0
+    while j < num_buckets:
+        bucket = j
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        j = int((bucket + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return bucket
+
+
+def get_update_user_id(update: dict[str, Any]) -> int | None:
+    for value in update.values():
+        if not isinstance(value, dict):
+            continue
+        user = value.get("from") or value.get("user") or value.get("chat")
+        if user:
+            return user["id"]
+    return None
+
+
+def shard_for_update(update: dict[str, Any], num_workers: int) -> int:
+    user_id = get_update_user_id(update)
+    return jump_consistent_hash(user_id if user_id is not None else update["update_id"], num_workers)
+
+
+def update_queue_key(index: int) -> str:
+    return f"{UPDATE_QUEUE_PREFIX}:{index}"
@@ -0,0 +1,199 @@
+import asyncio
+import os
+import threading
+import time
+import uuid
+from contextlib import suppress
+from functools import cache
+from typing import Any, Awaitable, Callable
+
+from config.config import get_config
+from services.logger import logger
+from services.serialization import dumps, loads
+
+
+class StagingQuotaExceeded(Exception):
+    pass
+
+
+class StagingArea:
+    # Временные файлы лежат в media/shelf/<partition>, а для каждого из них в media/.staging/<partition>
+    # хранится запись манифеста. Запись удаляется только после отправки файла в веб-сервис, поэтому
+    # после падения процесса по манифесту видно, какие файлы можно дозагрузить, а какие нужно удалить.
+    # У каждого процесса свой раздел и своя доля квоты: перезапущенный воркер восстанавливает
+    # только свои файлы, а занятое место и имена файлов записей хранятся в памяти без обхода каталога
+    # на каждый файл. Методы с файловым вводом-выводом вызываются из event loop через asyncio.to_thread.
+    def __init__(self, media_root: str, quota_bytes: int, max_age: float, partition: str = "main"):
+        self.media_root = media_root
+        self.partition = partition
+        self.files_dir = os.path.join(media_root, "shelf", partition)
+        self.manifest_dir = os.path.join(media_root, ".staging", partition)
+        self.quota_bytes = quota_bytes
+        self.max_age = max_age
+        # Размер каждой записи: ожидаемый при скачивании и фактический после mark_ready
+        self._sizes: dict[str, int] | None = None
+        self._files: dict[str, set[str]] = {}
+        self._lock = threading.Lock()
+
+    def allocate(self, ext: str, expected_size: int | None = None) -> tuple[str, str]:
+        expected_size = expected_size or 0
+        entry_id = str(uuid.uuid4())
+        with self._lock:
+            sizes = self._load_sizes()
+            usage = sum(sizes.values())
+            if usage + expected_size > self.quota_bytes:
+                logger.warning(
+                    "Квота временных файлов исчерпана: занято %s из %s байт", usage, self.quota_bytes
+                )
+                raise StagingQuotaExceeded("Недостаточно места для временных файлов, попробуйте позже.")
+            sizes[entry_id] = expected_size
+            self._files[entry_id] = {f"{entry_id}{ext}"}
+
+        relative_path = f"shelf/{self.partition}/{entry_id}{ext}"
+        self._write_manifest(
+            entry_id, {"state": "downloading", "path": relative_path, "created_at": time.time()}
+        )
+        return os.path.join(self.media_root, relative_path), relative_path
+
+    def mark_ready(self, relative_path: str, upload: dict[str, Any]):
+        entry_id = self._entry_id(relative_path)
+        with suppress(FileNotFoundError):
+            size = os.path.getsize(os.path.join(self.media_root, relative_path))
+            with self._lock:
+                self._load_sizes()[entry_id] = size
+                self._files.setdefault(entry_id, set()).add(os.path.basename(relative_path))
+        self._write_manifest(
+            entry_id,
+            {"state": "ready", "path": relative_path, "created_at": time.time(), "upload": upload},
+        )
+
+    def release(self, relative_path: str):
+        self._purge(self._entry_id(relative_path))
+
+    def usage(self) -> int:
+        with self._lock:
+            return sum(self._load_sizes().values())
+
+    async def recover(self, upload: Callable[..., Awaitable[Any]]):
+        resumed = failed = purged = 0
+        for entry_id, entry in await asyncio.to_thread(self._read_manifests):
+            if entry.get("state") != "ready" or not os.path.exists(os.path.join(self.media_root, entry["path"])):
+                await asyncio.to_thread(self._purge, entry_id)
+                purged += 1
+                continue
+
+            logger.info("Дозагрузка файла после перезапуска: %s", entry["path"])
+            try:
+                result = await upload(relative_path=entry["path"], **entry["upload"])
+            except Exception as e:
+                result = {"success": False, "error": str(e)}
+            if result.get("success"):
+                await asyncio.to_thread(self._purge, entry_id)
+                resumed += 1
+            else:
+                # Запись остается: файл попробуем отправить при следующем запуске, пока его не удалит cleanup
+                logger.error(
+                    "Не удалось дозагрузить %s (%s): %s", entry["path"], entry["upload"], result.get("error")
+                )
+                failed += 1
+
+        purged += await asyncio.to_thread(self._purge_orphans, 0)
+        logger.info(
+            "Восстановление временных файлов: дозагружено %s, не удалось %s, удалено %s", resumed, failed, purged
+        )
+
+    def cleanup(self):
+        now = time.time()
+        purged = 0
+        for entry_id, entry in self._read_manifests():
+            if now - entry.get("created_at", 0) > self.max_age:
+                if entry.get("state") == "ready":
+                    logger.warning("Удален неотправленный файл %s (%s)", entry.get("path"), entry.get("upload"))
+                self._purge(entry_id)
+                purged += 1
+        purged += self._purge_orphans(max_age=self.max_age)
+        if purged:
+            logger.info("Очистка временных файлов: удалено %s", purged)
+
+    def _load_sizes(self) -> dict[str, int]:
+        # Каталог обходится один раз за жизнь процесса, дальше размеры обновляются по ходу работы
+        if self._sizes is None:
+            os.makedirs(self.files_dir, exist_ok=True)
+            os.makedirs(self.manifest_dir, exist_ok=True)
+            sizes: dict[str, int] = {}
+            with os.scandir(self.files_dir) as entries:
+                for entry in entries:
+                    with suppress(FileNotFoundError):
+                        stem = os.path.splitext(entry.name)[0]
+                        sizes[stem] = sizes.get(stem, 0) + entry.stat().st_size
+                        self._files.setdefault(stem, set()).add(entry.name)
+            self._sizes = sizes
+        return self._sizes
+
+    def _forget(self, entry_id: str) -> set[str]:
+        with self._lock:
+            self._load_sizes().pop(entry_id, None)
+            return self._files.pop(entry_id, set())
+
+    def _entry_id(self, relative_path: str) -> str:
+        return os.path.splitext(os.path.basename(relative_path))[0]
+
+    def _manifest_path(self, entry_id: str) -> str:
+        return os.path.join(self.manifest_dir, f"{entry_id}.json")
+
+    def _write_manifest(self, entry_id: str, entry: dict[str, Any]):
+        path = self._manifest_path(entry_id)
+        with open(f"{path}.tmp", "w") as f:
+            f.write(dumps(entry))
+        os.replace(f"{path}.tmp", path)
+
+    def _read_manifests(self) -> list[tuple[str, dict[str, Any]]]:
+        if not os.path.isdir(self.manifest_dir):
+            return []
+        manifests = []
+        for name in os.listdir(self.manifest_dir):
+            entry_id, ext = os.path.splitext(name)
+            if ext != ".json":
+                continue
+            try:
+                with open(os.path.join(self.manifest_dir, name)) as f:
+                    manifests.append((entry_id, loads(f.read())))
+            except (OSError, ValueError) as e:
+                logger.warning("Поврежденная запись манифеста %s: %s", name, e)
+                manifests.append((entry_id, {}))
+        return manifests
+
+    def _purge(self, entry_id: str):
+        for name in self._forget(entry_id):
+            with suppress(FileNotFoundError):
+                os.remove(os.path.join(self.files_dir, name))
+        for path in (self._manifest_path(entry_id), f"{self._manifest_path(entry_id)}.tmp"):
+            with suppress(FileNotFoundError):
+                os.remove(path)
+
+    def _purge_orphans(self, max_age: float) -> int:
+        if not os.path.isdir(self.files_dir):
+            return 0
+        known = {entry_id for entry_id, _ in self._read_manifests()}
+        now = time.time()
+        purged = 0
+        for name in os.listdir(self.files_dir):
+            path = os.path.join(self.files_dir, name)
+            with suppress(FileNotFoundError):
+                if os.path.splitext(name)[0] in known or now - os.path.getmtime(path) < max_age:
+                    continue
+                os.remove(path)
+                self._forget(os.path.splitext(name)[0])
+                purged += 1
+        return purged
+
+
+@cache
+def get_staging() -> StagingArea:
+    config = get_config()
+    return StagingArea(
+        media_root="media",
+        quota_bytes=config.staging.quota_mb * 1024 * 1024 // config.workers.count,
+        max_age=config.staging.max_age,
+        partition="main" if config.workers.index is None else f"worker-{config.workers.index}",
+    )
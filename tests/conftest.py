@@ -0,0 +1,29 @@
+import asyncio
+
+import pytest
+
+from services.loop_monitor import LoopMonitor
+
+
+@pytest.fixture(autouse=True)
+def loop_monitor(request, monkeypatch):
+    # Каждый asyncio.run в тестах выполняется под LoopMonitor: блокировка event loop валит тест
+    if request.node.get_closest_marker("allow_blocking"):
+        return
+
+    run = asyncio.run
+
+    def monitored_run(main, **kwargs):
+        async def monitored():
+            monitor = LoopMonitor(interval=0.02, threshold=0.2)
+            monitor.start()
+            try:
+                result = await main
+            finally:
+                await monitor.stop()
+            monitor.check()
+            return result
+
+        return run(monitored(), **kwargs)
+
+    monkeypatch.setattr(asyncio, "run", monitored_run)
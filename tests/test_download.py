@@ -0,0 +1,90 @@
+import asyncio
+import io
+import os
+from datetime import datetime
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from handlers import utils
+from services.staging import StagingArea
+
+
+def make_photo(exif_time: datetime | None) -> bytes:
+    Image, piexif, _ = utils.load_image_stack()
+    buffer = io.BytesIO()
+    Image.new("RGB", (640, 480), "green").save(buffer, "JPEG")
+    if exif_time is None:
+        return buffer.getvalue()
+    stamp = exif_time.strftime("%Y:%m:%d %H:%M:%S").encode()
+    exif = piexif.dump({"0th": {piexif.ImageIFD.DateTime: stamp}})
+    output = io.BytesIO()
+    piexif.insert(exif, buffer.getvalue(), output)
+    return output.getvalue()
+
+
+def fresh_photo() -> bytes:
+    _, _, pytz = utils.load_image_stack()
+    return make_photo(datetime.now(pytz.timezone("Asia/Bishkek")))
+
+
+@pytest.fixture
+def staging(tmp_path, monkeypatch):
+    staging = StagingArea(media_root=str(tmp_path / "media"), quota_bytes=10 * 1024 * 1024, max_age=3600)
+    monkeypatch.setattr(utils, "get_staging", lambda: staging)
+    return staging
+
+
+async def download_over_http(photo: bytes, filename: str) -> str:
+    async def serve(request):
+        return web.Response(body=photo, content_type="image/jpeg")
+
+    app = web.Application()
+    app.router.add_get("/file", serve)
+    async with TestServer(app) as server:
+        return await utils.download_file(str(server.make_url("/file")), filename, file_size=len(photo))
+
+
+def test_download_file_saves_fresh_photo(staging):
+    photo = fresh_photo()
+
+    relative_path = asyncio.run(download_over_http(photo, "shelf.jpg"))
+
+    assert relative_path.startswith("shelf/main/") and relative_path.endswith(".jpg")
+    with open(os.path.join(staging.media_root, relative_path), "rb") as f:
+        assert f.read() == photo
+
+
+def test_download_file_rejects_photo_without_exif(staging):
+    with pytest.raises(Exception, match="метаданные"):
+        asyncio.run(download_over_http(make_photo(None), "shelf.jpg"))
+
+    assert staging.usage() == 0
+    assert os.listdir(staging.files_dir) == []
+
+
+def test_download_file_links_local_api_file(staging, tmp_path):
+    source = tmp_path / "api" / "photo.jpg"
+    source.parent.mkdir()
+    source.write_bytes(fresh_photo())
+
+    relative_path = asyncio.run(
+        utils.download_file("http://127.0.0.1:1/unused", "photo.jpg", local_path=str(source))
+    )
+
+    saved = os.path.join(staging.media_root, relative_path)
+    assert os.path.samefile(saved, source)
+
+
+def test_convert_heic_to_jpeg(tmp_path):
+    Image, _, _ = utils.load_image_stack()
+    heic_path = str(tmp_path / "photo.heic")
+    Image.new("RGB", (640, 480), "blue").save(heic_path, "HEIF")
+
+    jpeg_path = asyncio.run(utils.convert_heic_to_jpeg(heic_path))
+
+    assert jpeg_path == str(tmp_path / "photo.jpg")
+    with Image.open(jpeg_path) as img:
+        assert img.format == "JPEG"
+        assert img.size == (640, 480)
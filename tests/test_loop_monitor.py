@@ -0,0 +1,30 @@
+import asyncio
+import time
+
+import pytest
+
+from services.loop_monitor import BlockingCallError, LoopMonitor
+
+pytestmark = pytest.mark.allow_blocking
+
+
+async def run_monitored(blocking: float) -> LoopMonitor:
+    monitor = LoopMonitor(interval=0.02, threshold=0.2)
+    monitor.start()
+    await asyncio.sleep(0.1)
+    time.sleep(blocking)
+    await asyncio.sleep(0.1)
+    await monitor.stop()
+    return monitor
+
+
+def test_check_raises_on_blocking_call():
+    monitor = asyncio.run(run_monitored(blocking=0.6))
+    assert monitor.stall_count >= 1
+    with pytest.raises(BlockingCallError, match="run_monitored"):
+        monitor.check()
+
+
+def test_check_passes_without_blocking_calls():
+    monitor = asyncio.run(run_monitored(blocking=0))
+    monitor.check()
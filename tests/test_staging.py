@@ -0,0 +1,93 @@
+import asyncio
+import os
+
+import pytest
+
+from services.staging import StagingArea, StagingQuotaExceeded
+
+UPLOAD = {"shop_id": 1, "latitude": 42.87, "longitude": 74.59, "type_photo": "shelf"}
+
+
+def make_staging(tmp_path, quota_bytes: int = 1000) -> StagingArea:
+    return StagingArea(media_root=str(tmp_path), quota_bytes=quota_bytes, max_age=3600)
+
+
+def stage_file(staging: StagingArea, size: int, ready: bool = True) -> str:
+    save_path, relative_path = staging.allocate(".jpg", expected_size=size)
+    with open(save_path, "wb") as f:
+        f.write(b"x" * size)
+    if ready:
+        staging.mark_ready(relative_path, UPLOAD)
+    return relative_path
+
+
+def test_allocate_rejects_over_quota(tmp_path):
+    staging = make_staging(tmp_path)
+    stage_file(staging, 600)
+
+    with pytest.raises(StagingQuotaExceeded):
+        staging.allocate(".jpg", expected_size=500)
+    assert staging.usage() == 600
+
+
+def test_release_frees_quota_and_removes_files(tmp_path):
+    staging = make_staging(tmp_path)
+    relative_path = stage_file(staging, 600)
+
+    staging.release(relative_path)
+
+    assert staging.usage() == 0
+    assert os.listdir(staging.files_dir) == []
+    assert os.listdir(staging.manifest_dir) == []
+    staging.allocate(".jpg", expected_size=900)
+
+
+def test_usage_survives_restart(tmp_path):
+    stage_file(make_staging(tmp_path), 400)
+
+    assert make_staging(tmp_path).usage() == 400
+
+
+def test_recover_uploads_ready_files_and_purges_the_rest(tmp_path):
+    crashed = make_staging(tmp_path)
+    ready_path = stage_file(crashed, 100)
+    downloading_path = stage_file(crashed, 100, ready=False)
+    orphan_path = os.path.join(crashed.files_dir, "orphan.jpg")
+    with open(orphan_path, "wb") as f:
+        f.write(b"x")
+
+    uploaded = []
+
+    async def upload(relative_path, **upload):
+        uploaded.append((relative_path, upload))
+        return {"success": True}
+
+    staging = make_staging(tmp_path)
+    asyncio.run(staging.recover(upload))
+
+    assert uploaded == [(ready_path, UPLOAD)]
+    assert not os.path.exists(os.path.join(staging.media_root, downloading_path))
+    assert not os.path.exists(orphan_path)
+    assert os.listdir(staging.files_dir) == []
+    assert os.listdir(staging.manifest_dir) == []
+    assert staging.usage() == 0
+
+
+def test_recover_keeps_files_that_failed_to_upload(tmp_path):
+    ready_path = stage_file(make_staging(tmp_path), 100)
+
+    async def upload(relative_path, **upload):
+        raise ConnectionError("web service is down")
+
+    staging = make_staging(tmp_path)
+    asyncio.run(staging.recover(upload))
+
+    assert os.path.exists(os.path.join(staging.media_root, ready_path))
+    assert staging.usage() == 100
+
+    async def retry(relative_path, **upload):
+        return {"success": True}
+
+    asyncio.run(staging.recover(retry))
+    assert staging.usage() == 0
+    assert os.listdir(staging.files_dir) == []
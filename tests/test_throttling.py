@@ -0,0 +1,80 @@
+import asyncio
+from types import SimpleNamespace
+
+from middlewares.throttling import ThrottlingMiddleware, UploadLimiter
+
+
+class FakeMessage:
+    def __init__(self, user_id: int, document: bool = True):
+        self.from_user = SimpleNamespace(id=user_id)
+        self.document = object() if document else None
+        self.answers: list[str] = []
+
+    async def answer(self, text: str):
+        self.answers.append(text)
+
+
+async def fire_uploads(limiter: UploadLimiter, events: list[FakeMessage], albums=None) -> list[int]:
+    middleware = ThrottlingMiddleware(limiter)
+    peak_queue = 0
+    positions = []
+
+    async def handler(event, data):
+        nonlocal peak_queue
+        ticket = data["upload_ticket"]
+        positions.append(ticket.position)
+        await asyncio.sleep(0)
+        for _ in range(ticket.reserved):
+            peak_queue = max(peak_queue, limiter.queued)
+            async with ticket.heavy_slot():
+                await asyncio.sleep(0.01)
+
+    async def feed(index: int, event: FakeMessage):
+        data = {"handler": SimpleNamespace(flags={"heavy": True})}
+        if albums:
+            data["album"] = albums[index]
+        await middleware(handler, event, data)
+
+    await asyncio.gather(*(feed(i, event) for i, event in enumerate(events)))
+    assert limiter.queued == 0
+    assert limiter.active == 0
+    assert not limiter.in_flight
+    return [peak_queue, *positions]
+
+
+def test_burst_is_bounded_by_max_queue():
+    limiter = UploadLimiter(max_concurrent=1, max_per_user=1, max_queue=5)
+    events = [FakeMessage(user_id) for user_id in range(200)]
+
+    peak_queue, *positions = asyncio.run(fire_uploads(limiter, events))
+
+    rejected = [event for event in events if event.answers]
+    assert len(positions) == 5
+    assert len(rejected) == 195
+    assert peak_queue <= 5
+    assert positions == [0, 1, 2, 3, 4]
+
+
+def test_album_reserves_one_slot_per_document():
+    limiter = UploadLimiter(max_concurrent=1, max_per_user=1, max_queue=5)
+    first, second = FakeMessage(1), FakeMessage(2)
+    albums = [
+        [first, FakeMessage(1), FakeMessage(1), FakeMessage(1, document=False)],
+        [second, FakeMessage(2), FakeMessage(2)],
+    ]
+
+    peak_queue, *positions = asyncio.run(fire_uploads(limiter, [first, second], albums))
+
+    assert positions == [0]
+    assert second.answers
+    assert peak_queue <= 5
+
+
+def test_user_limit_rejects_parallel_uploads():
+    limiter = UploadLimiter(max_concurrent=2, max_per_user=1, max_queue=10)
+    events = [FakeMessage(1), FakeMessage(1)]
+
+    asyncio.run(fire_uploads(limiter, events))
+
+    assert not events[0].answers
+    assert events[1].answers == ["⏳ Дождитесь завершения предыдущей загрузки."]
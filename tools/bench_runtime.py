@@ -0,0 +1,132 @@
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+PROFILE = {"phone_number": "+996700123456"}
+SHOP = {"id": 42, "shop_name": "Магазин «Орими»", "owner_name": "Иван", "address": "г. Бишкек, ул. Ленина 1"}
+
+
+def make_update(update_id: int, user_id: int, text: str = "/help") -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(datetime.now().timestamp()),
+            "chat": {"id": user_id, "type": "private", "first_name": "Тест"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "Тест", "language_code": "ru"},
+            "text": text,
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(text)}],
+        },
+    }
+
+
+def bench_serialization(iterations: int) -> dict[str, float]:
+    from services.serialization import dumps, loads
+
+    payloads = {"profile": PROFILE, "shop": SHOP, "update": make_update(1, 1)}
+    results = {}
+    for name, payload in payloads.items():
+        encoded = dumps(payload)
+        started = time.perf_counter()
+        for _ in range(iterations):
+            loads(dumps(payload))
+        results[name] = (time.perf_counter() - started) / iterations * 1e6
+        assert loads(encoded) == payload
+    return results
+
+
+async def bench_dispatcher(updates: int, concurrency: int, port: int) -> float:
+    from aiohttp import web
+
+    from main import create_bot, create_dispatcher
+    from middlewares import user_profile
+    from tools.telegram_stub import TelegramStub
+
+    runner = web.AppRunner(TelegramStub(os.getcwd()).make_app(), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+
+    for user_id in range(concurrency):
+        user_profile._profile_cache[user_id] = (float("inf"), PROFILE)
+
+    bot = create_bot()
+    dp = create_dispatcher()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def feed(update_id: int):
+        async with semaphore:
+            await dp.feed_raw_update(bot, make_update(update_id, update_id % concurrency))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(feed(update_id) for update_id in range(updates)))
+    elapsed = time.perf_counter() - started
+
+    await bot.session.close()
+    await runner.cleanup()
+    return updates / elapsed
+
+
+def bench_env(port: int, fast: str) -> dict[str, str]:
+    return {
+        "FAST_RUNTIME": fast,
+        "LOG_LEVEL": "WARNING",
+        "SECRET_KEY": "1:bench",
+        "TELEGRAM_API_URL": f"http://127.0.0.1:{port}",
+        "REDIS_HOST": os.getenv("REDIS_HOST", "localhost"),
+        "REDIS_PORT": os.getenv("REDIS_PORT", "6379"),
+        "REDIS_DB": os.getenv("REDIS_DB", "0"),
+    }
+
+
+def run_mode(args):
+    from services.serialization import describe_runtime, get_loop_factory
+
+    serialization = bench_serialization(args.iterations)
+    throughput = asyncio.run(
+        bench_dispatcher(args.updates, args.concurrency, args.port), loop_factory=get_loop_factory())
+    cells = " ".join(f"{name}={value:.2f}us" for name, value in serialization.items())
+    print(f"{describe_runtime():<16} {cells} dispatcher={throughput:.0f} upd/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сравнение стандартного и быстрого (uvloop+orjson) режимов")
+    parser.add_argument("--iterations", type=int, default=50_000, help="итераций dumps+loads на payload")
+    parser.add_argument("--updates", type=int, default=2_000, help="обновлений через Dispatcher")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--port", type=int, default=8082, help="порт заглушки Bot API")
+    parser.add_argument("--mode", choices=["both", "current"], default="both")
+    args = parser.parse_args()
+
+    if args.mode == "current":
+        os.environ.update(bench_env(args.port, os.getenv("FAST_RUNTIME", "false")))
+        run_mode(args)
+        return
+
+    for fast in ("false", "true"):
+        subprocess.run(
+            [
+                sys.executable,
+                "-m",
+                "tools.bench_runtime",
+                "--mode",
+                "current",
+                "--iterations",
+                str(args.iterations),
+                "--updates",
+                str(args.updates),
+                "--concurrency",
+                str(args.concurrency),
+                "--port",
+                str(args.port),
+            ],
+            env={**os.environ, **bench_env(args.port, fast)},
+            check=True,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,15 @@
+import argparse
+import asyncio
+
+from handlers.utils import migrate_user_profiles
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Перенос профилей user:{id} из JSON-строк в hash")
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+    asyncio.run(migrate_user_profiles(batch_size=args.batch_size))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+import argparse
+import asyncio
+import glob
+import gzip
+import io
+import os
+import tempfile
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+from urllib.parse import urlsplit
+
+from services.serialization import loads
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".heic", ".heif", ".tiff", ".bmp"}
+
+
+def load_records(patterns: list[str]) -> list[dict]:
+    records = []
+    for pattern in patterns:
+        for path in sorted(glob.glob(pattern)):
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                try:
+                    for line in f:
+                        if line.strip():
+                            records.append(loads(line))
+                except (EOFError, gzip.BadGzipFile):
+                    # Файл, запись в который оборвалась, читаем до последней целой строки
+                    pass
+
+    if not records:
+        return records
+    started = min(record["ts"] for record in records)
+    for record in records:
+        record["t"] = record["ts"] - started
+    records.sort(key=lambda record: record["t"])
+    return records
+
+
+def get_kind(update: dict) -> str:
+    message = update.get("message")
+    if message and message.get("document"):
+        return "document"
+    return next((key for key in update if key != "update_id"), "unknown")
+
+
+def get_user_ids(records: list[dict]) -> set[int]:
+    user_ids = set()
+    for record in records:
+        for value in record["update"].values():
+            if isinstance(value, dict) and "from" in value:
+                user_ids.add(value["from"]["id"])
+    return user_ids
+
+
+def redis_env(url: str) -> dict[str, str]:
+    parsed = urlsplit(url)
+    db = parsed.path.lstrip("/")
+    if parsed.scheme != "redis" or not parsed.hostname or not db.isdigit():
+        raise ValueError("ожидается адрес вида redis://[:пароль@]хост:порт/номер_базы")
+    return {
+        "REDIS_HOST": parsed.hostname,
+        "REDIS_PORT": str(parsed.port or 6379),
+        "REDIS_DB": db,
+        "REDIS_PASSWORD": parsed.password or "",
+    }
+
+
+def get_document(record: dict) -> dict | None:
+    return (record["update"].get("message") or {}).get("document")
+
+
+def is_photo(document: dict) -> bool:
+    return os.path.splitext(document.get("file_name") or "")[1].lower() in IMAGE_EXTENSIONS
+
+
+def make_base_photo(sample_file: str | None) -> bytes:
+    if sample_file:
+        with open(sample_file, "rb") as f:
+            return f.read()
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.effect_noise((1280, 960), 64).convert("RGB").save(buffer, "JPEG", quality=85)
+    return buffer.getvalue()
+
+
+def with_fresh_exif(photo: bytes) -> bytes:
+    # Проверка в download_file пропускает только фото, снятые не раньше 5 минут назад
+    from handlers.utils import load_image_stack
+
+    _, piexif, pytz = load_image_stack()
+    now = datetime.now(pytz.timezone("Asia/Bishkek")).strftime("%Y:%m:%d %H:%M:%S").encode()
+    exif = piexif.dump({"0th": {piexif.ImageIFD.DateTime: now}, "Exif": {piexif.ExifIFD.DateTimeOriginal: now}})
+    output = io.BytesIO()
+    piexif.insert(exif, photo, output)
+    return output.getvalue()
+
+
+def prepare_files(records: list[dict], files_dir: str):
+    for record in records:
+        document = get_document(record)
+        if not document:
+            continue
+        if is_photo(document):
+            # Фото любого формата воспроизводятся как JPEG: свежий EXIF записывается перед отправкой апдейта
+            document["file_name"] = "file.jpg"
+            document["mime_type"] = "image/jpeg"
+            continue
+        path = os.path.join(files_dir, document["file_id"])
+        if not os.path.exists(path):
+            with open(path, "wb") as f:
+                f.write(bytes(document.get("file_size", 1024)))
+
+
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def print_report(latencies: dict[str, list[float]], errors: Counter, error_replies: int, elapsed: float, speed):
+    print(f"{'тип':<16}{'кол-во':>8}{'p50, мс':>10}{'p90, мс':>10}{'p99, мс':>10}{'max, мс':>10}{'ошибки':>8}")
+    all_latencies = []
+    for kind, values in sorted(latencies.items()):
+        all_latencies.extend(values)
+        print(
+            f"{kind:<16}{len(values):>8}"
+            f"{percentile(values, 0.5) * 1000:>10.1f}{percentile(values, 0.9) * 1000:>10.1f}"
+            f"{percentile(values, 0.99) * 1000:>10.1f}{max(values) * 1000:>10.1f}{errors[kind]:>8}"
+        )
+    total = len(all_latencies)
+    failed = sum(errors.values())
+    print(
+        f"{'всего':<16}{total:>8}"
+        f"{percentile(all_latencies, 0.5) * 1000:>10.1f}{percentile(all_latencies, 0.9) * 1000:>10.1f}"
+        f"{percentile(all_latencies, 0.99) * 1000:>10.1f}{max(all_latencies, default=0) * 1000:>10.1f}{failed:>8}"
+    )
+    print(
+        f"\nскорость {speed}x, длительность {elapsed:.1f} с, {total / elapsed if elapsed else 0:.1f} обновл./с, "
+        f"исключений {failed / total if total else 0:.2%}, ответов с ошибкой пользователю {error_replies}"
+    )
+
+
+async def seed_profiles(user_ids: set[int]) -> list[str]:
+    from config.redis_connect import get_redis
+    from handlers.utils import store_user_profile, user_profile_key
+
+    # Существующие профили не трогаем, а созданные удаляем после прогона
+    user_ids = sorted(user_ids)
+    async with get_redis().pipeline(transaction=False) as pipe:
+        for user_id in user_ids:
+            pipe.exists(user_profile_key(user_id))
+        exists = await pipe.execute()
+
+    seeded = []
+    for user_id, existed in zip(user_ids, exists):
+        if not existed:
+            await store_user_profile(user_id, {"phone_number": f"+996{user_id % 10**9:09d}"})
+            seeded.append(user_profile_key(user_id))
+    return seeded
+
+
+async def replay(args, records: list[dict], workdir: str, photo: bytes):
+    from aiohttp import web
+
+    from config.redis_connect import get_redis
+    from main import create_bot, create_dispatcher
+    from tools.telegram_stub import TelegramStub
+    from tools.web_service_stub import WebServiceStub
+
+    # media/ и файлы заглушки Bot API живут во временном каталоге, а не в рабочем дереве
+    files_dir = os.path.join(workdir, "telegram")
+    os.makedirs(files_dir)
+    prepare_files(records, files_dir)
+    os.chdir(workdir)
+
+    telegram = TelegramStub(files_dir)
+    runners = []
+    for app, port in (
+        (telegram.make_app(), args.telegram_port),
+        (WebServiceStub(args.web_latency).make_app(), args.web_port),
+    ):
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", port).start()
+        runners.append(runner)
+
+    seeded = [] if args.no_seed else await seed_profiles(get_user_ids(records))
+
+    bot = create_bot()
+    dp = create_dispatcher()
+    latencies: dict[str, list[float]] = defaultdict(list)
+    errors: Counter = Counter()
+
+    async def feed(record: dict, started: float):
+        due = started + record["t"] / args.speed
+        await asyncio.sleep(max(0.0, due - time.monotonic()))
+        kind = get_kind(record["update"])
+        document = get_document(record)
+        if document and is_photo(document):
+            with open(os.path.join(files_dir, document["file_id"]), "wb") as f:
+                f.write(with_fresh_exif(photo))
+        try:
+            await dp.feed_raw_update(bot, record["update"])
+        except Exception:
+            errors[kind] += 1
+        latencies[kind].append(time.monotonic() - due)
+
+    try:
+        started = time.monotonic()
+        await asyncio.gather(*(feed(record, started) for record in records))
+        elapsed = time.monotonic() - started
+
+        error_replies = sum(
+            1 for method, params in telegram.calls if str(params.get("text", "")).startswith(("❌", "❗", "⚠️"))
+        )
+        print_report(latencies, errors, error_replies, elapsed, args.speed)
+    finally:
+        if seeded:
+            await get_redis().delete(*seeded)
+        await bot.session.close()
+        for runner in runners:
+            await runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Воспроизведение записанного трафика через Dispatcher")
+    parser.add_argument("files", nargs="+", help="файлы updates-*.jsonl.gz (можно glob)")
+    parser.add_argument("--speed", type=float, default=1.0, help="ускорение: 1, 10, 100...")
+    parser.add_argument("--telegram-port", type=int, default=8081)
+    parser.add_argument("--web-port", type=int, default=8001)
+    parser.add_argument("--web-latency", type=float, default=0.02, help="задержка заглушки веб-сервиса, с")
+    parser.add_argument(
+        "--redis-url",
+        required=True,
+        help="отдельная база для прогона, например redis://localhost:6379/15",
+    )
+    parser.add_argument("--sample-file", help="JPEG, который отдается вместо каждого фото")
+    parser.add_argument("--no-seed", action="store_true", help="не создавать профили пользователей в Redis")
+    args = parser.parse_args()
+
+    records = load_records(args.files)
+    if not records:
+        parser.error("нет записей для воспроизведения")
+    try:
+        redis = redis_env(args.redis_url)
+    except ValueError as e:
+        parser.error(str(e))
+
+    # Конфигурация читается при первом обращении, поэтому окружение подменяется до импорта main
+    os.environ.pop("TRAFFIC_CAPTURE_DIR", None)
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ.update(
+        SECRET_KEY="1:replay",
+        TELEGRAM_API_URL=f"http://127.0.0.1:{args.telegram_port}",
+        TELEGRAM_API_LOCAL="false",
+        WEB_SERVICE_URL=f"http://127.0.0.1:{args.web_port}",
+        BOT_WORKERS="1",
+        **redis,
+    )
+
+    from services.serialization import get_loop_factory
+
+    photo = make_base_photo(args.sample_file)
+    try:
+        with_fresh_exif(photo)
+    except Exception as e:
+        parser.error(f"--sample-file должен быть JPEG: {e}")
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        try:
+            asyncio.run(replay(args, records, workdir, photo), loop_factory=get_loop_factory())
+        finally:
+            os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    main()
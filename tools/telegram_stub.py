@@ -0,0 +1,81 @@
+import argparse
+import itertools
+import os
+import time
+
+from aiohttp import web
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "orimi_shelf_stub", "username": "orimi_shelf_stub_bot"}
+
+
+class TelegramStub:
+    def __init__(self, files_dir: str, local: bool = False):
+        self.files_dir = os.path.abspath(files_dir)
+        self.local = local
+        self.calls: list[tuple[str, dict]] = []
+        self._message_ids = itertools.count(1)
+
+    def make_app(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 1024**2)
+        app.router.add_post("/bot{token}/{method}", self.handle_method)
+        app.router.add_get("/file/bot{token}/{path:.+}", self.handle_file)
+        return app
+
+    def _message(self, params: dict) -> dict:
+        return {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": int(params.get("chat_id", 0)), "type": "private"},
+            "from": BOT_USER,
+            "text": params.get("text", ""),
+        }
+
+    async def handle_method(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"].lower()
+        params = dict(await request.post())
+        self.calls.append((method, params))
+
+        if method == "getme":
+            result = BOT_USER
+        elif method == "getfile":
+            file_id = params["file_id"]
+            path = os.path.join(self.files_dir, file_id)
+            if not os.path.exists(path):
+                return web.json_response(
+                    {"ok": False, "error_code": 400, "description": "Bad Request: invalid file_id"}
+                )
+            result = {
+                "file_id": file_id,
+                "file_unique_id": file_id,
+                "file_size": os.path.getsize(path),
+                "file_path": path if self.local else f"documents/{file_id}",
+            }
+        elif method in ("sendmessage", "editmessagetext"):
+            result = self._message(params)
+        elif method == "getupdates":
+            result = []
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    async def handle_file(self, request: web.Request) -> web.StreamResponse:
+        path = os.path.join(self.files_dir, os.path.basename(request.match_info["path"]))
+        if self.local or not os.path.exists(path):
+            raise web.HTTPNotFound()
+        return web.FileResponse(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальная заглушка Telegram Bot API")
+    parser.add_argument("--files", default="media/stub", help="каталог с файлами; file_id — имя файла в нем")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--local", action="store_true", help="отдавать абсолютные пути, как локальный сервер")
+    args = parser.parse_args()
+
+    os.makedirs(args.files, exist_ok=True)
+    web.run_app(TelegramStub(args.files, local=args.local).make_app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
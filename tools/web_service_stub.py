@@ -0,0 +1,65 @@
+import argparse
+import asyncio
+import itertools
+
+from aiohttp import web
+
+
+class WebServiceStub:
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.requests = 0
+        self._ids = itertools.count(1)
+
+    def make_app(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 1024**2, middlewares=[self.delay])
+        app.router.add_get("/api/shops/{phone}", self.get_shop)
+        app.router.add_get("/api/telephones/", self.list_telephones)
+        app.router.add_get("/api/telephones-get/{phone}/", self.get_telephone)
+        app.router.add_patch("/api/telephones/{id}/", self.update_telephone)
+        app.router.add_post("/api/reports/", self.create_report)
+        app.router.add_post("/api/shop-posts/create/", self.create_post)
+        return app
+
+    @web.middleware
+    async def delay(self, request: web.Request, handler):
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return await handler(request)
+
+    async def get_shop(self, request: web.Request) -> web.Response:
+        phone = request.match_info["phone"]
+        shop_id = int("".join(filter(str.isdigit, phone)) or 0) % 10_000
+        return web.json_response(
+            {"id": shop_id, "shop_name": f"Магазин {shop_id}", "owner_name": "Владелец", "address": "Бишкек"}
+        )
+
+    async def list_telephones(self, request: web.Request) -> web.Response:
+        return web.json_response([])
+
+    async def get_telephone(self, request: web.Request) -> web.Response:
+        return web.json_response({"id": next(self._ids)})
+
+    async def update_telephone(self, request: web.Request) -> web.Response:
+        return web.json_response({"id": int(request.match_info["id"])})
+
+    async def create_report(self, request: web.Request) -> web.Response:
+        return web.json_response({"id": next(self._ids)}, status=201)
+
+    async def create_post(self, request: web.Request) -> web.Response:
+        await request.post()
+        return web.json_response({"id": next(self._ids)}, status=201)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальная заглушка веб-сервиса магазинов")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.0, help="искусственная задержка ответа, с")
+    args = parser.parse_args()
+    web.run_app(WebServiceStub(args.latency).make_app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()